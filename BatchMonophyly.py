@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""This script runs bayesian monophyly test for many jobs from manifest and
+saves all results into one CSV or JSON file."""
+from __future__ import division
+import sys
+import os
+import csv
+import json
+import itertools
+import collections
+import BayesMonophyly as bm
+
+def parse_args():
+    import argparse as arg
+    parser = arg.ArgumentParser(
+        prog="BatchMonophyly",
+        description=(
+            "Run bayesian monophyly test (see BayesMonophyly) for every job"
+            " in manifest and save results of all jobs into one CSV or JSON"
+            " file. Jobs whose input files overlap are evaluated together,"
+            " so that every file is parsed only once. Interrupted run is"
+            " resumed when it is started again with the same output."
+            )
+        )
+    parser.add_argument(
+        "-m", "--manifest", required=True,
+        help=(
+            "Manifest of jobs, either tab-separated table with header or"
+            " JSON list of objects, with columns (keys) \"job\" (unique name"
+            " of job), \"input\" (comma-separated tree files), \"groups\""
+            " (file with groups of species, see BayesMonophyly -g) or"
+            " \"species\" (comma-separated species of one group), and"
+            " optional \"burnin\" (0.2 by default, see BayesMonophyly -b),"
+            " \"thin\" and \"rooted\" (yes or no)."
+            " Relative paths are relative to directory of manifest."
+            )
+        )
+    parser.add_argument(
+        "-o", "--output", required=True,
+        help=(
+            "Output file, JSON if it ends with \".json\", otherwise CSV."
+            " Finished jobs are recorded in file with suffix \"{0}\" next to"
+            " it, which is used to resume interrupted run and is removed"
+            " when all jobs are finished.".format(PROGRESS_SUFFIX)
+            )
+        )
+    parser.add_argument(
+        "-j", "--jobs", required=False, default=1, type=int,
+        help=(
+            "Number of worker processes, every process evaluates all jobs"
+            " whose input files overlap at a time."
+            )
+        )
+    parser.add_argument(
+        "-e", "--engine", required=False, default="bitset",
+        choices=["bitset", "numpy"],
+        help="Method used to test monophyly, see BayesMonophyly."
+        )
+    parser.add_argument(
+        "--no-cache", required=False, default=False,
+        action="store_true",
+        help="Do not use or create cache of parsed input files."
+        )
+    args = parser.parse_args()
+    return(args)
+
+
+PROGRESS_SUFFIX = ".progress"
+
+COLUMNS = ["job", "input", "burnin", "thin", "rooted", "group", "species",
+           "monophyletic", "total", "expected", "prior", "posterior",
+           "bayes_factor", "posterior_mcse", "ess", "bayes_factor_lower",
+           "bayes_factor_upper", "log_bayes_factor", "error"]
+
+
+def parse_bool(text):
+    """Parse yes/no value of manifest."""
+    if isinstance(text, bool):
+        return(text)
+    if str(text).strip().lower() in ["yes", "true", "1"]:
+        return(True)
+    if str(text).strip().lower() in ["no", "false", "0", ""]:
+        return(False)
+    raise ValueError("Expected yes or no, found \"{0}\".".format(text))
+
+
+def parse_manifest(manifestfile):
+    """Parse manifest of jobs.
+
+    Manifest is either JSON list of objects or tab-separated table with
+    header, see parse_args for its columns. Lists in table are separated by
+    commas.
+
+    Parameters
+    ----------
+    manifestfile : string
+        path to manifest
+
+    Returns
+    -------
+    jobs : list of dictionaries
+        name of job, list of input files, list of groups of species (see
+        BayesMonophyly.parse_groups_file), burnin, thinning and whether
+        trees are rooted
+    """
+    try:
+        manifest_file = open(manifestfile, "r")
+    except IOError:
+        raise bm.ParsingError("Couldn't open file, does file exists?")
+    with manifest_file:
+        if manifestfile.endswith(".json"):
+            entries = json.load(manifest_file)
+        else:
+            lines = (line for line in manifest_file
+                     if line.strip() and not line.startswith("#"))
+            entries = list(csv.DictReader(lines, delimiter="\t"))
+    directory = os.path.dirname(manifestfile)
+    to_list = lambda value: (value if isinstance(value, list)
+                             else str(value).replace(",", " ").split())
+    jobs = []
+    for num, entry in enumerate(entries):
+        name = str(entry.get("job") or "job_{0}".format(num + 1))
+        try:
+            input_files = [os.path.join(directory, input_file)
+                           for input_file in to_list(entry.get("input", ""))]
+            if not input_files:
+                raise ValueError("No input file.")
+            if entry.get("groups"):
+                groups = bm.parse_groups_file(os.path.join(
+                    directory, entry["groups"]))
+            elif entry.get("species"):
+                groups = [(name, to_list(entry["species"]))]
+            else:
+                raise ValueError("No groups or species.")
+            for group_name, species in groups:
+                bm.check_species_group(species)
+            #burnin is 20% of trees by default, as in BayesMonophyly
+            burnin = entry.get("burnin")
+            burnin = 0.2 if burnin in [None, ""] else float(burnin)
+            thin = int(entry.get("thin") or 1)
+            if burnin < 0 or thin < 1:
+                raise ValueError("Burnin can't be negative and thinning"
+                                 " must be positive.")
+            rooted = parse_bool(entry.get("rooted", False))
+        except (ValueError, bm.ParsingError) as error:
+            raise bm.ParsingError("{0} (job {1})".format(error, name))
+        jobs.append({"job": name, "input": input_files, "groups": groups,
+                     "burnin": burnin, "thin": thin, "rooted": rooted})
+    if len(set(job["job"] for job in jobs)) < len(jobs):
+        raise bm.ParsingError("Names of jobs are not unique.")
+    return(jobs)
+
+
+def job_rows(job, results=None, error=None):
+    """Return rows of output for every group of job, or one row with error
+    if job failed."""
+    row = {"job": job["job"], "input": ",".join(job["input"]),
+           "burnin": job["burnin"], "thin": job["thin"],
+           "rooted": job["rooted"]}
+    if error is not None:
+        row["error"] = str(error)
+        return([row])
+    rows = []
+    for result in results:
+        result_row = dict(row)
+        result_row.update(result.as_dict())
+        result_row["species"] = ",".join(result.species)
+        rows.append(result_row)
+    return(rows)
+
+
+def evaluate_file_set(task):
+    """Evaluate all jobs whose input files overlap.
+
+    Every input file is parsed only once (or read from cache), into tree
+    sample held in memory (see BayesMonophyly.cached_tree_sample), which is
+    shared by all jobs with this file, whatever other files, burnin,
+    thinning or rootedness they have. Jobs with the same input files are
+    then grouped by burnin, thinning and rootedness and groups of all jobs
+    with this combination are tested together. Weighted tree files are
+    small and are evaluated for every job (see
+    BayesMonophyly.monophyly_analysis). Errors are recorded in results of
+    jobs, so that other jobs are not lost.
+
+    Parameters
+    ----------
+    task : tuple
+        list of jobs, whether cache is used and engine
+
+    Returns
+    -------
+    results : list of tuples
+        name of job and its rows of output (see job_rows)
+    """
+    (jobs, use_cache, engine) = task
+    loaded = dict()
+    def load_sample(input_file):
+        #error is kept too, so that file is not parsed again for every job
+        if input_file not in loaded:
+            try:
+                loaded[input_file] = (bm.cached_tree_sample(input_file)
+                                      if use_cache
+                                      else bm.parse_tree_sample(input_file))
+            except (IOError, bm.ParsingError, RuntimeError) as error:
+                loaded[input_file] = error
+        if isinstance(loaded[input_file], Exception):
+            raise loaded[input_file]
+        return(loaded[input_file])
+    file_sets = collections.OrderedDict()
+    for job in jobs:
+        file_sets.setdefault(tuple(job["input"]), []).append(job)
+    results = []
+    for input_files, file_set_jobs in file_sets.iteritems():
+        results.extend(evaluate_jobs(list(input_files), file_set_jobs,
+                                     load_sample, engine))
+    return(results)
+
+
+def evaluate_jobs(input_files, jobs, load_sample, engine):
+    """Evaluate jobs with the same input files, with samples loaded by
+    load_sample (see evaluate_file_set)."""
+    results = []
+    try:
+        if bm.are_weighted_tree_files(input_files):
+            for job in jobs:
+                try:
+                    results.append((job["job"], job_rows(
+                        job, bm.monophyly_analysis(
+                            input_files, job["groups"], rooted=job["rooted"],
+                            engine=engine))))
+                except (IOError, bm.ParsingError, RuntimeError,
+                        ValueError) as error:
+                    results.append((job["job"], job_rows(job, error=error)))
+            return(results)
+        samples = [load_sample(input_file) for input_file in input_files]
+        all_translated_taxa = [sample[0] for sample in samples]
+        bm.check_species_equivalency(all_translated_taxa)
+    except (IOError, bm.ParsingError, RuntimeError, ValueError) as error:
+        return([(job["job"], job_rows(job, error=error)) for job in jobs])
+    translated_taxa = all_translated_taxa[0]
+    settings = collections.OrderedDict()
+    for job in jobs:
+        try:
+            for name, species in job["groups"]:
+                bm.check_species_in_taxa(species, translated_taxa)
+        except RuntimeError as error:
+            results.append((job["job"], job_rows(job, error=error)))
+            continue
+        settings.setdefault((job["burnin"], job["thin"], job["rooted"]),
+                            []).append(job)
+    for (burnin, thin, rooted), setting_jobs in settings.iteritems():
+        groups = list(itertools.chain.from_iterable(
+            job["groups"] for job in setting_jobs))
+        species_groups = [bm.translate_species(translated_taxa, species)
+                          for name, species in groups]
+        all_burnins = [bm.burnin_trees(len(sample[2]), burnin, thin)
+                       for sample in samples]
+        num_total = sum(len(xrange(sample_burnin, len(sample[2]), thin))
+                        for sample_burnin, sample in zip(all_burnins,
+                                                         samples))
+        if not num_total:
+            error = ValueError("No trees left after burnin.")
+            results.extend((job["job"], job_rows(job, error=error))
+                           for job in setting_jobs)
+            continue
+        batch_means = bm.BatchMeans(len(groups), num_total)
+        #every distinct topology of sample is tested only once, samples
+        #are evaluated in order, so that batch means get trees in order
+        monophyletic_counters = [sum(counts) for counts in zip(*[
+            bm.cached_solution(sample, sample_burnin, thin, species_groups,
+                               rooted, engine, batch_means)
+            for sample, sample_burnin in zip(samples, all_burnins)])]
+        group_results = iter(bm.monophyly_results(
+            groups, monophyletic_counters, num_total, len(translated_taxa),
+            rooted, batch_means=batch_means))
+        for job in setting_jobs:
+            results.append((job["job"], job_rows(job, list(
+                itertools.islice(group_results, len(job["groups"]))))))
+    return(results)
+
+
+def overlapping_jobs(jobs):
+    """Split jobs into lists of jobs whose input files overlap, directly or
+    through other jobs, so that every input file is loaded only in one
+    task (see evaluate_file_set). Order of jobs is kept."""
+    #every file points to other file of the same task, until the first one
+    parents = dict()
+    def first_file(input_file):
+        while parents.setdefault(input_file, input_file) != input_file:
+            input_file = parents[input_file]
+        return(input_file)
+    for job in jobs:
+        for input_file in job["input"][1:]:
+            parents[first_file(input_file)] = first_file(job["input"][0])
+    tasks = collections.OrderedDict()
+    for job in jobs:
+        tasks.setdefault(first_file(job["input"][0]), []).append(job)
+    return(tasks.values())
+
+
+def read_progress(progressfile):
+    """Return rows of already finished jobs recorded in progress file. Line
+    which was not written completely when run was interrupted is removed,
+    so that new jobs are appended after the last finished one."""
+    finished = dict()
+    if not os.path.exists(progressfile):
+        return(finished)
+    complete = 0
+    with open(progressfile, "r+b") as progress_file:
+        for line in progress_file:
+            try:
+                (job, rows) = json.loads(line)
+            except ValueError:
+                break
+            if not line.endswith("\n"):
+                break
+            finished[job] = rows
+            complete += len(line)
+        progress_file.truncate(complete)
+    return(finished)
+
+
+def format_value(value):
+    """Format value for CSV output, missing values are "NA"."""
+    if value is None:
+        return("NA")
+    if isinstance(value, bool):
+        return("yes" if value else "no")
+    return(str(value))
+
+
+def save_results(outputfile, jobs, finished):
+    """Save rows of all jobs, in order of manifest, as CSV or JSON."""
+    rows = list(itertools.chain.from_iterable(finished[job["job"]]
+                                              for job in jobs))
+    with open(outputfile, "wb") as output:
+        if outputfile.endswith(".json"):
+            #standard JSON has no infinity
+            json.dump(bm.json_value(rows), output, indent=1, sort_keys=True)
+            return
+        writer = csv.writer(output)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([format_value(row.get(column))
+                             for column in COLUMNS])
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.jobs < 1:
+        print "ERROR: Number of worker processes must be positive."
+        sys.exit()
+    if args.engine == "numpy":
+        try:
+            import numpy
+        except ImportError:
+            sys.stderr.write("NumPy is not installed, bitset engine is used"
+                             " instead.\n")
+            args.engine = "bitset"
+    try:
+        jobs = parse_manifest(args.manifest)
+    except bm.ParsingError as error:
+        print "ERROR: {0}".format(error)
+        sys.exit()
+    progressfile = args.output + PROGRESS_SUFFIX
+    finished = read_progress(progressfile)
+    num_resumed = sum(1 for job in jobs if job["job"] in finished)
+    tasks = [(task_jobs, not args.no_cache, args.engine)
+             for task_jobs in overlapping_jobs(
+                 [job for job in jobs if job["job"] not in finished])]
+    pool = None
+    if args.jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(args.jobs)
+        results = pool.imap_unordered(evaluate_file_set, tasks, chunksize=1)
+    else:
+        results = itertools.imap(evaluate_file_set, tasks)
+    try:
+        with open(progressfile, "a") as progress_file:
+            for task_results in results:
+                for job, rows in task_results:
+                    progress_file.write(json.dumps([job, rows]) + "\n")
+                    finished[job] = rows
+                progress_file.flush()
+                sys.stderr.write("Finished {0} of {1} jobs.\n".format(
+                    len(finished), len(jobs)))
+    except KeyboardInterrupt:
+        sys.stderr.write("Interrupted, run again with the same output to"
+                         " resume.\n")
+        sys.exit(1)
+    finally:
+        if pool is not None:
+            pool.terminate()
+    save_results(args.output, jobs, finished)
+    os.remove(progressfile)
+    num_failed = sum(1 for job in jobs
+                     if any("error" in row for row in finished[job["job"]]))
+    sys.stderr.write("Saved results of {0} jobs ({1} resumed, {2} failed)"
+                     " into {3}.\n".format(len(jobs), num_resumed,
+                                           num_failed, args.output))
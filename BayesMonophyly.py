@@ -1,12 +1,25 @@
 """This script will perform bayesian monophyly test on output from MrBayes or BEAST."""
 from __future__ import division
 import sys
+import atexit
 import re
+import os
 import math
-import argparse as arg
+import random
+import time
+import io
+import json
+import array
+import hashlib
+import binascii
+import itertools
+import functools
+import contextlib
+import collections
 
 
 def parse_args():
+    import argparse as arg
     parser = arg.ArgumentParser(
         prog="BayesMonophyly",
         description=(
@@ -19,22 +32,54 @@ def parse_args():
             " information regarding monophyly)."
             )
         )
-    parser.add_argument(
-        "-s", "--species", required=True, nargs="*",
+    species = parser.add_mutually_exclusive_group(required=True)
+    species.add_argument(
+        "-s", "--species", nargs="*",
         help="Species that should be monophyletic"
         )
-    parser.add_argument(
-        "-i", "--input", required=True, nargs="+",
+    species.add_argument(
+        "-g", "--groups",
+        help=(
+            "File with several groups of species that should be monophyletic,"
+            " one group per line, optionally prefixed by \"name:\"."
+            " All groups are tested with a single reading of trees"
+            " and result is printed as table with one row per group."
+            )
+        )
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument(
+        "-i", "--input", nargs="+",
         help=(
             "One or more MrBayes or BEAST input files."
             "More files should be used only from the same analysis"
             "(i.e., where it actually make sense, such as standard"
-            " two runs from MrBayes analysis)."
+            " two runs from MrBayes analysis). Files with weighted trees"
+            " ([&W weight] before every tree), such as .trprobs files from"
+            " MrBayes sumt, are also accepted."
+            )
+        )
+    source.add_argument(
+        "-t", "--table",
+        help=(
+            "Split table saved by --save-table. Trees are not read again,"
+            " monophyly is only looked up in table."
             )
         )
     parser.add_argument(
         "-b", "--burnin", required=False, default=0.2,
-        type=int, help="Number of trees ignored as burnin phase"
+        type=float, help=(
+            "Trees ignored as burnin phase in every input file, either as"
+            " fraction of trees (smaller than one, 0.2 by default) or as"
+            " number of trees. Burnin is not applied to weighted trees, such"
+            " as .trprobs files from MrBayes."
+            )
+        )
+    parser.add_argument(
+        "--thin", required=False, default=1, type=int,
+        help=(
+            "Use only every k-th tree after burnin. Skipped trees are only"
+            " counted and never parsed."
+            )
         )
     parser.add_argument(
         "-r", "--rooted", required=False, default=False,
@@ -44,6 +89,133 @@ def parse_args():
             "(e.g. BEAST always assume some molecular clock)."
             )
         )
+    parser.add_argument(
+        "-e", "--engine", required=False, default="bitset",
+        choices=["bitset", "numpy", "ete2"],
+        help=(
+            "Method used to test monophyly. Native \"bitset\" is fast"
+            " and does not require ete2, \"numpy\" tests trees in batches"
+            " with NumPy, which is faster for many groups and large trees"
+            " (bitset is used if NumPy is not installed), \"ete2\" is kept"
+            " for comparison."
+            )
+        )
+    parser.add_argument(
+        "--tolerance", required=False, type=float,
+        help=(
+            "Sequential mode for quick screening of large samples. Trees are"
+            " read in strided rounds, each doubling number of trees used,"
+            " until 95%% confidence interval of posterior of every group is"
+            " narrower than tolerance (e.g. 0.05). Number of trees actually"
+            " used is reported."
+            )
+        )
+    parser.add_argument(
+        "-f", "--follow", required=False, default=False,
+        action="store_true",
+        help=(
+            "Follow input files of running MCMC and print posterior and"
+            " Bayes factor every --interval seconds, reading only newly"
+            " appended trees. Burnin smaller than one is fraction of trees"
+            " read so far, otherwise it is fixed number of trees."
+            " Stops when MCMC finishes or on interrupt."
+            )
+        )
+    parser.add_argument(
+        "--interval", required=False, default=60, type=float,
+        help="Seconds between updates with --follow."
+        )
+    parser.add_argument(
+        "--exact-prior", required=False, default=False,
+        action="store_true",
+        help=(
+            "Compute prior from exact numbers of trees instead of in log"
+            " space. This is slow for many taxa and is intended only for"
+            " validation."
+            )
+        )
+    parser.add_argument(
+        "--prior-model", required=False, choices=PRIOR_MODELS,
+        help=(
+            "Estimate prior by simulation of random topologies under uniform,"
+            " Yule or coalescent model instead of computing it for uniform"
+            " distribution of topologies. Results are remembered for every"
+            " size of group. Uses --jobs worker processes."
+            )
+        )
+    parser.add_argument(
+        "--prior-samples", required=False, default=1000000, type=int,
+        help="Number of topologies simulated with --prior-model."
+        )
+    parser.add_argument(
+        "--seed", required=False, type=int,
+        help=(
+            "Seed of random number generator for --prior-model. If not given,"
+            " random seed is used and printed to stderr."
+            )
+        )
+    parser.add_argument(
+        "-j", "--jobs", required=False, default=1, type=int,
+        help=(
+            "Number of worker processes. Input files are split into chunks"
+            " of trees, which are parsed and evaluated in parallel. Trees of"
+            " files with valid cache are split in the same way and only"
+            " evaluated by workers. Only already existing cache is used,"
+            " files without valid cache are parsed by workers and cache is"
+            " not created for them."
+            )
+        )
+    parser.add_argument(
+        "--memo-size", required=False, default=50, type=float,
+        help=(
+            "Memory in MB for results of the most recently seen distinct"
+            " trees, which are remembered and reused when the same tree is"
+            " sampled again (in every worker process with -j). Statistics"
+            " of reused results are printed to stderr. Zero disables"
+            " memoization."
+            )
+        )
+    parser.add_argument(
+        "--profile", required=False, default=False,
+        action="store_true",
+        help=(
+            "Print wall time, number of trees per second and peak memory of"
+            " every stage of run (reading, stripping of comments and branch"
+            " lengths, parsing of clades, cache, ete2 trees, monophyly and"
+            " prior) to stderr."
+            )
+        )
+    parser.add_argument(
+        "--profile-json", required=False,
+        help="Save profile also as JSON into file (implies --profile)."
+        )
+    parser.add_argument(
+        "--no-cache", required=False, default=False,
+        action="store_true",
+        help=(
+            "Do not use or create cache of parsed input files. By default,"
+            " every input file is parsed only once and saved into binary"
+            " file with suffix \"{0}\" next to it, which is used until"
+            " input file changes.".format(CACHE_SUFFIX)
+            )
+        )
+    parser.add_argument(
+        "--save-table", required=False,
+        help=(
+            "Save table of all splits (bipartitions) found in trees after"
+            " burnin and their counts, so that any monophyly can be later"
+            " looked up with --table without reading trees again."
+            )
+        )
+    parser.add_argument(
+        "--consensus", required=False,
+        help=(
+            "Save majority-rule consensus tree (of splits found in more than"
+            " half of trees after burnin) in newick format into file, with"
+            " frequency of every split as label of its node. Consensus is"
+            " made from split table, so it is also available with --table."
+            )
+        )
     args = parser.parse_args()
     return(args)
 
@@ -53,7 +225,7 @@ class ParsingError(Exception):
     pass
 
 
-def parse_tree_file(treefile):
+def parse_tree_file(treefile, burnin=0, thin=1):
     """Parse posterior tree sample file from BEAST or MrBayes.
 
     Parse posterior tree sample file generated by MrBayes or BEAST software.
@@ -62,8 +234,54 @@ def parse_tree_file(treefile):
     list of species in trees and their translation, as names are translated
     into numbers. Tree block contains posterior sample of trees.
 
-    This parser will search this file and returns Translate block and trees.
-    There are several checks employed to ensure, that parsing is correct.
+    This parser will read Translate block and returns it together with
+    generator, which reads trees from file one by one, so that file is never
+    held in memory as a whole. There are several checks employed to ensure,
+    that parsing is correct.
+
+    Lines with trees ignored as burnin or skipped by thinning are only
+    counted, they are not processed.
+
+    Parameters
+    ----------
+    treefile : string
+        path to file that is to be parsed
+    burnin : int
+        number of trees skipped at the beginning of file
+    thin : int
+        only every thin-th tree after burnin is read
+
+    Returns
+    -------
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    trees : generator of strings
+        trees, cladograms in text form
+    """
+    (translated_taxa, tree_lines) = read_tree_lines(treefile)
+    tree_lines = profiler.timed(
+        itertools.islice(tree_lines, burnin, None, thin), "read")
+    trees = profiler.timed((strip_tree(line) for line in tree_lines),
+                           "strip")
+    return(translated_taxa, trees)
+
+
+def burnin_trees(num_trees, burnin, thin=1):
+    """Return number of trees ignored as burnin. Burnin is either fraction
+    of trees (less than one) or fixed number of trees.
+
+    Burnin is rounded up to multiple of thin, so that thinning always keeps
+    the same trees, counted from the first tree in file, regardless of
+    burnin.
+    """
+    if burnin < 1:
+        burnin = int(num_trees*burnin)
+    burnin = min(int(burnin), num_trees)
+    return(-(-burnin // thin) * thin)
+
+
+def read_tree_lines(treefile):
+    """Read Translate block and return generator of lines with trees.
 
     Parameters
     ----------
@@ -74,31 +292,96 @@ def parse_tree_file(treefile):
     -------
     translated_taxa : dictionary
         original names of species in file and their numeric translation
+    tree_lines : generator of strings
+        unprocessed lines of Tree block, one tree per line
     """
-    tree_file_text = []
     try:
-        tree_file = open(treefile,"r")
+        tree_file = open_tree_file(treefile)
     except IOError:
         raise ParsingError("Couldn't open file, does file exists?")
-    else:
-        with tree_file:
-            tree_file_text = tree_file.readlines()
+    try:
+        (translated_taxa, first_line) = parse_translate_block(tree_file)
+    except:
+        tree_file.close()
+        raise
+    return(translated_taxa, iter_tree_lines(tree_file, first_line))
+
+
+COMPRESSION_MAGIC = [
+    ("gzip", "\x1f\x8b"),
+    ("bz2", "BZh"),
+    ("xz", "\xfd7zXZ\x00"),
+    ]
+
+
+def compression_format(treefile):
+    """Return compression format of file ("gzip", "bz2" or "xz"), detected
+    from its first bytes, or None if file is not compressed."""
+    with open(treefile, "rb") as tree_file:
+        start = tree_file.read(6)
+    for compression, magic in COMPRESSION_MAGIC:
+        if start.startswith(magic):
+            return(compression)
+    return(None)
+
+
+def open_tree_file(treefile):
+    """Open tree file for reading.
+
+    Compressed files are decompressed on the fly while they are read, so
+    they are never decompressed to disk or whole into memory. Reading of
+    xz files requires lzma module, which is available in python 2 as
+    backports.lzma.
+    """
+    compression = compression_format(treefile)
+    if compression == "gzip":
+        import gzip
+        return(io.BufferedReader(gzip.open(treefile, "rb")))
+    elif compression == "bz2":
+        import bz2
+        return(bz2.BZ2File(treefile, "rb"))
+    elif compression == "xz":
+        try:
+            import lzma
+        except ImportError:
+            try:
+                from backports import lzma
+            except ImportError:
+                raise ParsingError("Reading of xz compressed file requires"
+                                   " lzma module (backports.lzma).")
+        return(io.BufferedReader(lzma.LZMAFile(treefile, "rb")))
+    return(open(treefile, "r"))
+
+
+def parse_translate_block(tree_file):
+    """Read file up to first tree and return Translate block and this tree.
+
+    Parameters
+    ----------
+    tree_file : file
+        opened posterior tree sample file, iterated from its beginning
+
+    Returns
+    -------
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    first_line : string
+        line with first tree
+    """
     #Various checks:
     #first line must be #NEXUS
-    if(tree_file_text[0].strip("\n\t ").lower() != "#nexus"):
+    if(next(tree_file, "").strip("\n\t ").lower() != "#nexus"):
         raise ParsingError("No NEXUS header. Is file NEXUS?")
 
     #find begin trees
-    begin_block_start = 0
-    for num,line in enumerate(tree_file_text):
+    for line in tree_file:
         if line.strip("\n\t ").lower() == "begin trees;":
-            begin_block_start=num
             break
-    if begin_block_start == 0:
+    else:
         raise ParsingError("Begin trees block not found!")
 
     #check if following one is translate:
-    if tree_file_text[begin_block_start+1].strip("\n\t ").lower() != "translate":
+    if next(tree_file, "").strip("\n\t ").lower() != "translate":
         raise ParsingError(
                 "ERROR: Misformed Begin trees block,"
                 " \"translate\" not found."
@@ -108,47 +391,209 @@ def parse_tree_file(treefile):
     #but because taxa block is not required 
     #number of taxa is not known and must be estimated from translate
     translated_taxa = dict()
-    begin_block_end = 0
-    for num,line in enumerate(tree_file_text[begin_block_start+2 : ]):
-        pair = line.strip("\n\t, ").split()
+    for line in tree_file:
+        entry = line.strip("\n\t, ")
+        pair = entry.rstrip(";").split()
         if len(pair) != 2:
-            begin_block_end = num + begin_block_start + 2
             break
         else:
             translated_taxa[int(pair[0]) ] = pair[1]
-    #check if begin_block_end has changed:
-    if begin_block_end == 0:
+        #MrBayes ends translate block with ";" after the last taxon
+        if entry.endswith(";"):
+            break
+    else:
         raise ParsingError("ERROR: end of translation block not found.")
 
     #now, every tree should start with "tree", so find a first tree, if not next:
-    trees_start = 0
-    for num,line in enumerate(tree_file_text[begin_block_end + 1 : ]):
+    for line in tree_file:
         if line.strip("\n\t ")[0:4].lower() == "tree":
-            trees_start = num + begin_block_end + 1
             break
-    #test if trees_start changed:
-    if trees_start == 0:
+    else:
         raise ParsingError("ERROR: no tree was found!")
-    trees = []
-    #read all trees and put them into list
-    for line in tree_file_text[trees_start:]:
-        #get tree
-        line=line.strip("\n\t ;")
-        if line.lower() == "end":
-            #end of tree block
-            break
-        tree=line.split(" = ")[1].strip()
-        if(tree[0:5] == "[&U] "): #remove "[&U] ", if present
-            tree = tree[5:]
-        #delete [&something=number] tags from BEAST
-        #TODO better matching is required
-        #in my file, I am currently matching only [&rate=number]
-        if "[" in tree:
-            tree = re.sub("\[&\w+=[0-9]*\.?[0-9]*([eE]-[0-9]+)?\]", "", tree)
-        #get cladogram
-        tree = re.sub(":[0-9]+\.?[0-9]*([eE]-[0-9]+)?", "", tree)
-        trees.append(tree)
-    return(translated_taxa, trees)
+    return(translated_taxa, line)
+
+
+def iter_tree_lines(tree_file, line):
+    """Yield lines with trees, starting with already read line, until end of
+    Tree block. File is closed when generator is exhausted or discarded."""
+    with tree_file:
+        for line in itertools.chain([line], tree_file):
+            line = line.strip("\n\t ;")
+            if line.lower() == "end":
+                #end of tree block
+                break
+            yield line
+
+
+def index_tree_file(treefile):
+    """Return Translate block and byte offsets of all trees in file.
+
+    Trees are not processed, only positions of their lines are recorded, so
+    that file can be later split into chunks with whole trees, which can be
+    read independently (see read_tree_chunk).
+
+    Returns
+    -------
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    offsets : array of ints
+        byte offset of every line with tree, followed by offset of the end
+        of the last tree
+    """
+    position = [0]
+    def counted_lines(tree_file):
+        for line in tree_file:
+            position[0] += len(line)
+            yield line
+    try:
+        tree_file = open(treefile,"rb")
+    except IOError:
+        raise ParsingError("Couldn't open file, does file exists?")
+    offsets = array.array("L")
+    with tree_file:
+        lines = counted_lines(tree_file)
+        (translated_taxa, line) = parse_translate_block(lines)
+        for line in itertools.chain([line], lines):
+            offsets.append(position[0] - len(line))
+            if line.strip("\n\t ;").lower() == "end":
+                #end of tree block
+                break
+        else:
+            offsets.append(position[0])
+    return(translated_taxa, offsets)
+
+
+def read_tree_chunk(treefile, start, end, thin=1):
+    """Yield every thin-th tree from part of file between byte offsets start
+    and end, which must be offsets of lines with trees (see index_tree_file).
+    """
+    with open(treefile, "rb") as tree_file:
+        tree_file.seek(start)
+        position = start
+        num = 0
+        while position < end:
+            line = tree_file.readline()
+            position += len(line)
+            if num % thin == 0:
+                yield strip_tree(line.strip("\n\t ;"))
+            num += 1
+
+
+def read_strided_lines(treefile, offsets, start, thin):
+    """Yield line of every thin-th tree from start-th tree of file with byte
+    offsets of trees (see index_tree_file). Lines are read directly at their
+    offsets, so that lines of skipped trees are never read."""
+    with open(treefile, "rb") as tree_file:
+        for index in xrange(start, len(offsets) - 1, thin):
+            tree_file.seek(offsets[index])
+            yield tree_file.readline().strip("\n\t ;")
+
+
+WEIGHT_COMMENT = re.compile("\[&W\s+([^\]\s]+)\s*\]")
+
+
+def tree_weight(line):
+    """Return weight of tree from [&W weight] comment, as written by MrBayes
+    into .trprobs files or by BEAST, or None if tree has no weight. Weight
+    can be number or fraction such as 1/3."""
+    match = WEIGHT_COMMENT.search(split_tree_line(line)[1])
+    if match is None:
+        return(None)
+    weight = match.group(1)
+    try:
+        if "/" in weight:
+            (numerator, denominator) = weight.split("/")
+            return(float(numerator) / float(denominator))
+        return(float(weight))
+    except (ValueError, ZeroDivisionError):
+        raise ParsingError("Misformed weight of tree: {0}".format(weight))
+
+
+def is_weighted_tree_file(treefile):
+    """Check if trees in file are weighted, judging by the first tree."""
+    (translated_taxa, tree_lines) = read_tree_lines(treefile)
+    weighted = tree_weight(next(tree_lines)) is not None
+    tree_lines.close()
+    return(weighted)
+
+
+def are_weighted_tree_files(treefiles):
+    """Check if trees in all files are weighted (see is_weighted_tree_file).
+    Weighted and unweighted files can't be combined, because weights of
+    trees are not comparable with number of trees."""
+    weighted = set(is_weighted_tree_file(treefile) for treefile in treefiles)
+    if len(weighted) > 1:
+        raise ValueError("Weighted and unweighted tree files can't be"
+                         " combined.")
+    return(True in weighted)
+
+
+def parse_weighted_tree_file(treefile):
+    """Parse file with weighted trees.
+
+    Weighted trees, such as .trprobs file from MrBayes sumt, list every
+    distinct topology only once with its posterior probability as weight
+    (see tree_weight). Otherwise, file is parsed as any other tree file
+    (see parse_tree_file).
+
+    Returns
+    -------
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    trees : generator of tuples
+        trees, cladograms in text form, and their weights
+    """
+    (translated_taxa, tree_lines) = read_tree_lines(treefile)
+    def weighted_trees():
+        for line in tree_lines:
+            weight = tree_weight(line)
+            if weight is None:
+                raise ParsingError("Tree without weight in file with"
+                                   " weighted trees: {0}".format(line[:50]))
+            yield(strip_tree(line), weight)
+    return(translated_taxa, weighted_trees())
+
+
+def split_tree_line(line):
+    """Split line with tree into name of tree and tree at the first "="
+    outside of comments, as comments such as "[p = 0.5]" can precede it."""
+    depth = 0
+    for num, char in enumerate(line):
+        if char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+        elif char == "=" and depth == 0:
+            return(line[:num].strip(), line[num + 1:].strip())
+    raise ParsingError("Tree not found on line: {0}".format(line[:50]))
+
+
+#Tokens of newick tree, which are not part of cladogram: comments, such as
+#[&U] or BEAST annotations [&rate=0.1,height_95%_HPD={0.2,0.3}], with
+#whitespace after them and branch lengths in any notation. Quoted labels
+#(the only group) are matched too, so that their content is skipped.
+CLADOGRAM_NOISE = re.compile(r"('(?:[^']|'')*')|\[[^\]]*\]\s*|:[^,()\[;]*")
+
+
+def keep_quoted_label(match):
+    """Return quoted label matched by CLADOGRAM_NOISE, drop anything else."""
+    return(match.group(1) or "")
+
+
+def strip_newick(tree):
+    """Return cladogram from tree in newick format.
+
+    Comments and branch lengths are removed in single pass of compiled
+    tokenizer (see CLADOGRAM_NOISE), quoted labels are kept intact.
+    """
+    if "'" in tree:
+        return(CLADOGRAM_NOISE.sub(keep_quoted_label, tree))
+    return(CLADOGRAM_NOISE.sub("", tree))
+
+
+def strip_tree(line):
+    """Get cladogram from line with tree."""
+    return(strip_newick(split_tree_line(line)[1]))
 
 
 def check_species_in_taxa(species,translated_taxa):
@@ -211,41 +656,278 @@ def check_species_equivalency(list_of_dicts):
                                         )
 
 
-def ete2solution(trees, translated_species):
-    """Return number of monophyletic trees for input species.
+#default memory budget of TopologyMemo in bytes
+MEMO_SIZE = 50 * 1024**2
+
+
+def memo_entry_size(value):
+    """Return estimated size of memoized cladogram or result in bytes,
+    together with its items, such as integers of Clades."""
+    size = sys.getsizeof(value)
+    if isinstance(value, (tuple, list)):
+        size += sum(sys.getsizeof(item) for item in value)
+        if isinstance(value, Clades):
+            #frozenset of clades, see Clades.__contains__
+            size += 64 * len(value) + 232
+    return(size)
+
+
+class TopologyMemo(object):
+    """Bounded LRU memo of results computed for cladograms in text form.
+
+    Well mixed MCMC samples the same topology many times, so result for
+    every distinct cladogram is computed only once and reused, as long as
+    it is among the most recently seen cladograms, whose estimated size
+    together with their results (see memo_entry_size) fits into maxsize
+    bytes. Size of result grows with number of taxa, so memory is bounded
+    by bytes and not by number of cladograms. Numbers of reused (hits) and
+    computed (misses) results are counted.
+    """
+    def __init__(self, maxsize=MEMO_SIZE):
+        self.maxsize = maxsize
+        self.size = 0
+        self.results = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def evaluate(self, tree, function):
+        """Return function(tree), computed only if not memoized."""
+        try:
+            (result, size) = self.results.pop(tree)
+        except KeyError:
+            self.misses += 1
+            result = function(tree)
+            if self.maxsize <= 0:
+                return(result)
+            #with item of ordered dictionary
+            size = memo_entry_size(tree) + memo_entry_size(result) + 100
+            if size > self.maxsize:
+                return(result)
+            self.size += size
+            while self.size > self.maxsize:
+                self.size -= self.results.popitem(last=False)[1][1]
+        else:
+            self.hits += 1
+        self.results[tree] = (result, size)
+        return(result)
+
+    def report(self):
+        """Return hit and miss statistics as text."""
+        total = self.hits + self.misses
+        return(("Topology memo: {0} hits, {1} misses ({2:.1f}% of trees"
+                " reused)\n").format(self.hits, self.misses,
+                                     100 * self.hits / total if total else 0))
+
+
+def peak_memory(who="self"):
+    """Return peak resident memory of this process (or of its largest
+    finished child process) in MB, or None where it can't be measured."""
+    try:
+        import resource
+    except ImportError:
+        return(None)
+    usage = resource.getrusage(resource.RUSAGE_SELF if who == "self" else
+                               resource.RUSAGE_CHILDREN)
+    #kilobytes on Linux, bytes on Mac OS
+    return(usage.ru_maxrss / (1024**2 if sys.platform == "darwin" else 1024))
+
+
+class Profiler(object):
+    """Wall time, number of trees and peak memory of stages of run.
+
+    Trees are read, stripped and parsed lazily by chained generators, so
+    time spent in generator wrapped by timed is attributed to its stage and
+    not to stage that consumes it, and the same holds for nested stages.
+    Times of all stages therefore sum to wall time of run, time outside of
+    any stage is "other". Peak memory of stage is peak resident memory of
+    process at its end, as it is measured only as maximum over whole run.
+    Profiler is disabled until enable is called and costs nothing otherwise.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.seconds = collections.OrderedDict()
+        self.trees = collections.Counter()
+        self.peak_memory = dict()
+        self.current = "other"
+
+    def enable(self):
+        self.enabled = True
+        self.started = self.switched = time.time()
+
+    def switch(self, stage, memory=False):
+        """Attribute time since the last switch to current stage, continue
+        with stage and return previous stage. With memory, peak memory of
+        current stage is recorded."""
+        if not self.enabled:
+            return(None)
+        if memory:
+            self.peak_memory[self.current] = peak_memory()
+        now = time.time()
+        previous = self.current
+        self.seconds[previous] = (self.seconds.get(previous, 0) +
+                                  now - self.switched)
+        self.current = stage
+        self.switched = now
+        return(previous)
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        """Context in which time is attributed to stage."""
+        if not self.enabled:
+            yield
+            return
+        previous = self.switch(stage)
+        try:
+            yield
+        finally:
+            self.switch(previous, memory=True)
+
+    def timed(self, iterable, stage):
+        """Return iterable, whose items are produced in stage and counted
+        as trees of stage."""
+        if not self.enabled:
+            return(iterable)
+        return(self.timed_items(iter(iterable), stage))
+
+    def timed_items(self, iterator, stage):
+        while True:
+            previous = self.switch(stage)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.switch(previous, memory=True)
+                return
+            except:
+                self.switch(previous)
+                raise
+            self.switch(previous)
+            self.trees[stage] += 1
+            yield item
+
+    def timed_function(self, function, stage):
+        """Return function, which is run in stage."""
+        if not self.enabled:
+            return(function)
+        def timed(*args):
+            with self.stage(stage):
+                return(function(*args))
+        return(timed)
+
+    def add_trees(self, stage, num_trees):
+        """Count trees processed in stage, which are not counted by timed."""
+        if self.enabled:
+            self.trees[stage] += num_trees
+
+    def records(self):
+        """Return profile as list of dictionaries, one for every stage."""
+        self.switch(self.current, memory=True)
+        records = []
+        for stage, seconds in self.seconds.iteritems():
+            num_trees = self.trees.get(stage, 0)
+            records.append({
+                "stage": stage, "seconds": seconds, "trees": num_trees,
+                "trees_per_second": (num_trees / seconds if num_trees and
+                                     seconds else None),
+                "peak_rss_mb": self.peak_memory.get(stage)})
+        return(records)
+
+    def report(self, jsonfile=None):
+        """Return profile as text table and, if jsonfile is given, save it
+        also as JSON."""
+        records = self.records()
+        total = {"seconds": time.time() - self.started,
+                 "peak_rss_mb": peak_memory(),
+                 "children_peak_rss_mb": peak_memory("children")}
+        if jsonfile is not None:
+            with open(jsonfile, "w") as output:
+                json.dump({"script": os.path.basename(sys.argv[0]),
+                           "arguments": sys.argv[1:], "total": total,
+                           "stages": records}, output, indent=1,
+                          sort_keys=True)
+        format_value = lambda value, text: ("NA" if value is None
+                                            else text.format(value))
+        lines = ["Profile:", "\t".join(["stage", "seconds", "trees",
+                                        "trees_per_second", "peak_rss_mb"])]
+        for record in records:
+            lines.append("\t".join([
+                record["stage"], "{0:.3f}".format(record["seconds"]),
+                str(record["trees"]),
+                format_value(record["trees_per_second"], "{0:.0f}"),
+                format_value(record["peak_rss_mb"], "{0:.1f}")]))
+        lines.append("\t".join([
+            "total", "{0:.3f}".format(total["seconds"]), "", "",
+            format_value(total["peak_rss_mb"], "{0:.1f}")]))
+        if total["children_peak_rss_mb"]:
+            lines.append("Peak memory of worker processes: {0:.1f} MB".format(
+                total["children_peak_rss_mb"]))
+        return("\n".join(lines) + "\n")
+
+
+#profile of run, enabled by --profile
+profiler = Profiler()
+
+
+def ete2solution(trees, species_groups, rooted, memo=None, weights=None,
+                 batch_means=None):
+    """Return number of monophyletic trees for every group of input species.
 
     Converts trees from string to ete2.Tree and check if specific species
-    are monophyletic.
+    are monophyletic. Every tree is converted only once for all groups.
 
     Parameters
     ----------
-    trees : list of strings
+    trees : iterable of strings
         trees, cladograms in text form
-    translated_species : list of strings
-        list of species for monophyly, translated into numeric form
+    species_groups : list of lists of strings
+        groups of species for monophyly, translated into numeric form
+    rooted : bool
+        whether trees are rooted
+    memo : TopologyMemo, optional
+        memo of results for repeated trees, nothing is memoized if not given
+    weights : iterable of floats, optional
+        weight of every tree, every tree is counted once if not given
+    batch_means : BatchMeans, optional
+        if given, monophyly of every tree is added to it in order of trees
 
     Returns
     -------
-    monophyletic_counter : int
-        number of monophyletic trees
+    monophyletic_counters : list of ints or floats
+        number (or weight) of monophyletic trees for every group
     """
-    monophyletic_counter = 0
     import ete2
-    for tree in trees:
+    def check_tree(tree):
         try:
-            ete2_tree=ete2.Tree(tree + ";")
+            with profiler.stage("ete2_trees"):
+                ete2_tree=ete2.Tree(tree + ";")
         except ete2.parser.newick.NewickError:
-            print tree
-            raise RuntimeError("Problem with turning text into tree with ete2!")
-        try:
-            if ete2_tree.check_monophyly(values=translated_species,
-                                         target_attr="name")[0]:
-                monophyletic_counter += 1
-        except ValueError:
-            print translated_species
-            print tree
-            raise RuntimeError("Species are not in tree. Error in translating?")
-    return(monophyletic_counter)
+            raise RuntimeError("Problem with turning text into tree with"
+                               " ete2: {0}".format(tree))
+        monophyletic = []
+        for translated_species in species_groups:
+            try:
+                monophyletic.append(ete2_tree.check_monophyly(
+                    values=translated_species, target_attr="name",
+                    unrooted=not rooted)[0])
+            except ValueError:
+                raise RuntimeError("Species {0} are not in tree {1}. Error"
+                                   " in translating?".format(
+                                       ",".join(map(str, translated_species)),
+                                       tree))
+        return(monophyletic)
+
+    if memo is None:
+        memo = TopologyMemo(0)
+    if weights is None:
+        weights = itertools.repeat(1)
+    monophyletic_counters = [0] * len(species_groups)
+    for tree, weight in itertools.izip(trees, weights):
+        monophyletic = memo.evaluate(tree, check_tree)
+        for num, value in enumerate(monophyletic):
+            if value:
+                monophyletic_counters[num] += weight
+        if batch_means is not None:
+            batch_means.add(monophyletic)
+    return(monophyletic_counters)
 
 
 def translate_species(translate_dict, species):
@@ -255,106 +937,2343 @@ def translate_species(translate_dict, species):
     return(translated_species)
 
 
-def non_ete2solution(tree, species):
-    """ I think that solution would be with re.sub"""
-    pass #TODO
+NEWICK_TOKEN = re.compile("[(),]|[^(),;\s]+")
 
 
-def n_unrooted_trees(n):
-    """Returns number of unrooted trees for n taxa."""
-    return math.factorial(2*n-5) / (2**(n-3) * math.factorial(n-3))
+class Clades(tuple):
+    """Clades of tree as tuple of integer bitmasks, the root being the last.
 
+    Membership of clade is tested in frozenset of all clades, which is built
+    on the first test, so that every test takes constant time. Clades are
+    memoized per topology (see TopologyMemo), so that the set is built only
+    once for every distinct topology and then used for all groups and trees.
+    """
+    def __contains__(self, mask):
+        try:
+            masks = self.masks
+        except AttributeError:
+            masks = self.masks = frozenset(self)
+        return(mask in masks)
 
-def n_rooted_trees(n):
-    """Returns number of rooted trees for n taxa."""
-    return math.factorial(2*n-3) / (2**(n-2) * math.factorial(n-2))
 
+def tree_clades(tree):
+    """Return clades of cladogram as integer bitmasks.
 
-def bayes_factor(prior, posterior):
-    """Compute standard Bayes factor from prior and posterior."""
-    if prior in [0,1]:
-        #raise some error
-        pass
-    elif posterior == 1:
-        #raise warning?
-        pass
-    bayes_factor = (posterior/(1-posterior)) / (prior/(1-prior))
-    return(bayes_factor)
+    Cladogram is read as it is written, i.e., as a rooted tree. Every taxon is
+    represented by a bit at position given by its number from the Translate
+    block, so that clade is an integer with bits of all of its taxa set.
 
+    Parameters
+    ----------
+    tree : string
+        tree, cladogram in text form with taxa as numbers
 
-def compute_prior(num_taxa, num_species, rooted):
-    """Compute prior probability for trees, either rooted or unrooted."""
-    if rooted:
-        prior = (n_rooted_trees(num_taxa-num_species+1)* \
-                n_rooted_trees(num_species)) / n_rooted_trees(num_taxa)
-    else:
-        prior = (n_unrooted_trees(num_taxa-num_species+1)* \
-                n_rooted_trees(num_species)) / n_unrooted_trees(num_taxa)
+    Returns
+    -------
+    clades : Clades
+        bitmasks of all inner nodes, the root (i.e., all taxa) being the last
+    """
+    clades = []
+    stack = []
+    mask = 0
+    closed = False
+    for token in NEWICK_TOKEN.findall(tree):
+        if token == "(":
+            stack.append(mask)
+            mask = 0
+        elif token == ")":
+            if not stack:
+                raise RuntimeError("Unbalanced parentheses in tree: {0}"
+                                   .format(tree))
+            clades.append(mask)
+            mask |= stack.pop()
+            closed = True
+            continue
+        elif token != "," and not closed:
+            #label directly after ")" belongs to inner node, not to taxon
+            try:
+                mask |= 1 << int(token)
+            except ValueError:
+                raise RuntimeError("Taxon \"{0}\" is not a number in tree {1}."
+                                   " Error in translating?".format(token, tree))
+        closed = False
+    if stack or not clades:
+        raise RuntimeError("Unbalanced parentheses in tree: {0}"
+                           .format(tree))
+    return(Clades(clades))
 
-    #Can't actually happen, this equation does not work for some special cases:
-    #TODO
-    #Question is, how to treat those values?
-    #
-    if prior == 1:
-        raise ValueError("Prior is one.")
-    if prior == 0:
-        raise ValueError("Prior is zero.")
-    return(prior)
 
+def species_mask(translated_species):
+    """Return bitmask of species translated into numeric form."""
+    mask = 0
+    for specie in translated_species:
+        mask |= 1 << int(specie)
+    return(mask)
 
-def compute_posterior(num_monophyletic, num_total):
-    """Compute posterior probability of monophyletic trees."""
-    posterior = num_monophyletic / num_total
-    #posterior 0 can happen and is legitimate
-    #posterior 1 however destroys bayes factor (division by zero)
-    if posterior == 1:
-        raise ValueError("Posterior is one")
-    return(posterior)
 
+def is_monophyletic(clades, mask, rooted):
+    """Check if species given by bitmask form clade in tree.
 
-if __name__ == "__main__":
-    args=parse_args()
-    #analysis makes sense only for 2 and more species:
-    if len(args.species) < 2:
-        print "ERROR: Must specify at least 2 species."
-        sys.exit()
-    #also, the species must be different:
-    if len(set(args.species)) < len(args.species):
-        print "ERROR: Please, make sure that species are unique."
-        sys.exit()
+    For unrooted trees, position of root is arbitrary, so species are
+    monophyletic also if all other taxa form a clade (i.e., both groups
+    are separated by single branch).
 
-    #read all input files
-    all_translated_taxa = []
-    all_trees = []
-    for input_file in args.input:
-        (translated_taxa,trees) = parse_tree_file(input_file)
-        check_species_in_taxa(args.species,translated_taxa)
-        all_translated_taxa.append(translated_taxa)
-        all_trees.append(trees)
-    
-    check_species_equivalency(all_translated_taxa)
-    #if equivalent, every file has same species, can use the first one
-    #apply burnin
-    all_trees_burned = [trees[int(len(trees)*args.burnin):] for trees in all_trees]
-    all_trees_burned = [inner for outer in all_trees_burned for inner in outer]
-    num_total = len(all_trees_burned)
-    translated_species = translate_species(all_translated_taxa[0], args.species)
-    num_monophyletic = ete2solution(all_trees_burned, translated_species)
-    prior = compute_prior(len(all_translated_taxa[0]),
-                          len(translated_species), args.rooted)
-    posterior = compute_posterior(num_monophyletic, num_total)
-    bayes_factor=bayes_factor(prior, posterior)
-    #output:
-    all_trees_burned_num = len(all_trees_burned)
-    all_trees_num = sum([len(item) for item in all_trees])
-    expected_monophyletic = int(round(prior*all_trees_burned_num))
-    if(prior > 0.0001 and posterior > 0.0001 and bayes_factor > 0.0001):
+    Parameters
+    ----------
+    clades : Clades
+        bitmasks of clades of tree, as returned by tree_clades
+    mask : int
+        bitmask of species for monophyly
+    rooted : bool
+        whether tree is rooted
+
+    Returns
+    -------
+    monophyletic : bool
+    """
+    if mask in clades:
+        return(True)
+    if not rooted:
+        complement = clades[-1] ^ mask
+        #single taxon is always separated by branch from the rest of tree
+        return(complement & (complement - 1) == 0 or complement in clades)
+    return(False)
+
+
+def bitset_solution(trees, species_groups, rooted, weights=None,
+                    batch_means=None, keep_indicators=False):
+    """Return number of monophyletic trees for every group of input species.
+
+    Native solution without ete2. Every tree is parsed once into clades
+    represented as integer bitmasks (see tree_clades) and monophyly is then
+    only comparison of species bitmask with these clades.
+
+    Parameters
+    ----------
+    trees : iterable of lists of ints
+        clades of trees, as returned by tree_clades or cached_tree_sample
+    species_groups : list of lists of strings
+        groups of species for monophyly, translated into numeric form
+    rooted : bool
+        whether trees are rooted
+    weights : iterable of floats, optional
+        weight of every tree, every tree is counted once if not given
+    batch_means : BatchMeans, optional
+        if given, monophyly of every tree is added to it in order of trees
+    keep_indicators : bool
+        whether monophyly of every tree is kept and returned as well
+
+    Returns
+    -------
+    monophyletic_counters : list of ints or floats
+        number (or weight) of monophyletic trees for every group
+    indicators : list of lists of bools
+        only with keep_indicators, monophyly of every group (items) in
+        every tree (lists)
+    """
+    masks = [species_mask(species) for species in species_groups]
+    all_species = species_mask(itertools.chain(*species_groups))
+    if weights is None:
+        weights = itertools.repeat(1)
+    monophyletic_counters = [0] * len(masks)
+    kept_indicators = []
+    for clades, weight in itertools.izip(trees, weights):
+        if clades[-1] & all_species != all_species:
+            raise missing_species_error(species_groups, clades)
+        monophyletic = [is_monophyletic(clades, mask, rooted)
+                        for mask in masks]
+        for num, value in enumerate(monophyletic):
+            if value:
+                monophyletic_counters[num] += weight
+        if batch_means is not None:
+            batch_means.add(monophyletic)
+        if keep_indicators:
+            kept_indicators.append(monophyletic)
+    if keep_indicators:
+        return(monophyletic_counters, kept_indicators)
+    return(monophyletic_counters)
+
+
+def monophyly_indicators(trees, masks, rooted):
+    """Check monophyly of every group of species in batch of trees at once.
+
+    Clades of all trees are packed into single array of fixed-width binary
+    keys, which is sorted by NumPy, and bitmasks of all groups are then
+    looked up at once by binary search, so that time does not grow with
+    number of groups as with comparison of every clade. Monophyly is decided
+    in the same way as in is_monophyletic.
+
+    Parameters
+    ----------
+    trees : list of lists of ints
+        clades of trees, as returned by tree_clades or cached_tree_sample
+    masks : list of ints
+        bitmasks of groups of species for monophyly
+    rooted : bool
+        whether trees are rooted
+
+    Returns
+    -------
+    indicators : numpy array of bools
+        monophyly of every group (rows) in every tree (columns)
+    """
+    import numpy
+    num_bits = max(max(clades[-1] for clades in trees), max(masks))
+    width = max(1, -(-num_bits.bit_length() // 8))
+    def to_keys(bitmasks):
+        #bitmask is written as hexadecimal number, which is read as
+        #big-endian bytes of fixed width
+        text = "".join("{0:0{1}x}".format(bitmask, 2 * width)
+                       for bitmask in bitmasks)
+        return(numpy.frombuffer(binascii.unhexlify(text),
+                                dtype="S{0}".format(width)))
+
+    keys = to_keys(itertools.chain.from_iterable(trees))
+    order = numpy.argsort(keys, kind="mergesort")
+    keys = keys[order]
+    tree_of_clade = numpy.repeat(numpy.arange(len(trees)),
+                                 [len(clades) for clades in trees])[order]
+    indicators = numpy.zeros((len(masks), len(trees)), dtype=bool)
+    def find(bitmasks):
+        queries = to_keys(bitmasks)
+        return(zip(numpy.searchsorted(keys, queries, side="left"),
+                   numpy.searchsorted(keys, queries, side="right")))
+
+    for num, (start, end) in enumerate(find(masks)):
+        indicators[num][tree_of_clade[start:end]] = True
+    if not rooted:
+        #complement of species is given by the root, which is usually the
+        #same for all trees
+        roots = sorted(set(clades[-1] for clades in trees))
+        root_index = dict((root, num) for num, root in enumerate(roots))
+        tree_roots = numpy.array([root_index[clades[-1]] for clades in trees])
+        for num_root, root in enumerate(roots):
+            with_root = tree_roots == num_root
+            complements = [root ^ mask for mask in masks]
+            for num, (start, end) in enumerate(find(complements)):
+                complement = complements[num]
+                #single taxon is always separated by branch from the rest
+                if complement & (complement - 1) == 0:
+                    indicators[num] |= with_root
+                    continue
+                found = tree_of_clade[start:end]
+                indicators[num][found[with_root[found]]] = True
+    return(indicators)
+
+
+def numpy_solution(trees, species_groups, rooted, weights=None,
+                   batch_means=None, batch_size=250, keep_indicators=False):
+    """Return number of monophyletic trees for every group of input species.
+
+    Trees are tested in batches of batch_size trees by NumPy (see
+    monophyly_indicators), so that memory is bounded by size of batch.
+    Parameters and results are the same as for bitset_solution. With
+    keep_indicators, monophyly of every tree is kept and returned as
+    well, as boolean matrix of all groups (rows) and all trees (columns),
+    for statistics that need whole sequence of trees; batch_means then gets
+    this whole matrix at once.
+    """
+    import numpy
+    masks = [species_mask(species) for species in species_groups]
+    all_species = species_mask(itertools.chain(*species_groups))
+    if weights is None:
+        weights = itertools.repeat(1)
+    trees = itertools.izip(trees, weights)
+    monophyletic_counters = [0] * len(masks)
+    kept_indicators = []
+    while True:
+        batch = list(itertools.islice(trees, batch_size))
+        if not batch:
+            break
+        (batch_trees, batch_weights) = zip(*batch)
+        for clades in batch_trees:
+            if clades[-1] & all_species != all_species:
+                raise missing_species_error(species_groups, clades)
+        batch_weights = numpy.array(batch_weights)
+        indicators = monophyly_indicators(batch_trees, masks, rooted)
+        for num, indicator in enumerate(indicators):
+            monophyletic_counters[num] += batch_weights[indicator].sum().item()
+        if keep_indicators:
+            kept_indicators.append(indicators)
+        elif batch_means is not None:
+            batch_means.add_indicators(indicators)
+    if not keep_indicators:
+        return(monophyletic_counters)
+    indicators = numpy.hstack([numpy.zeros((len(masks), 0), dtype=bool)] +
+                              kept_indicators)
+    if batch_means is not None:
+        batch_means.add_indicators(indicators)
+    return(monophyletic_counters, indicators)
+
+
+def tree_splits(clades, rooted):
+    """Return set of nontrivial splits of tree.
+
+    For rooted trees, splits are simply clades without the root. For
+    unrooted trees, every clade is turned into bipartition of taxa, which is
+    represented by the side without the lowest numbered taxon, so that the
+    same split is always represented by the same bitmask regardless of where
+    the tree is rooted. Splits separating single taxon are trivial and are
+    not included.
+
+    Parameters
+    ----------
+    clades : list of ints
+        bitmasks of clades of tree, as returned by tree_clades
+    rooted : bool
+        whether tree is rooted
+
+    Returns
+    -------
+    splits : set of ints
+        bitmasks of splits
+    """
+    if rooted:
+        return(set(clades[:-1]))
+    taxa = clades[-1]
+    lowest = taxa & -taxa
+    splits = set()
+    for clade in clades[:-1]:
+        if clade & lowest:
+            clade ^= taxa
+        rest = taxa ^ clade
+        if clade & (clade - 1) and rest & (rest - 1):
+            splits.add(clade)
+    return(splits)
+
+
+def topology_key(clades, rooted):
+    """Return canonical representation of topology of tree.
+
+    Topology is given by its nontrivial splits (see tree_splits), so sorted
+    tuple of splits is the same for all trees with the same topology,
+    regardless of order of nodes in text or, for unrooted trees, position
+    of root. Such tuple can be directly compared and hashed.
+    """
+    return(tuple(sorted(tree_splits(clades, rooted))))
+
+
+def splits_newick(splits, translated_taxa, labels=None):
+    """Return tree with given splits in newick format.
+
+    Splits, as returned by tree_splits, are clades of tree either rooted as
+    it is (rooted trees) or rooted by the lowest numbered taxon (unrooted
+    trees), so tree is built by placing every split and taxon into the
+    smallest split containing it.
+
+    Parameters
+    ----------
+    splits : iterable of ints
+        bitmasks of splits of tree
+    translated_taxa : dictionary
+        original names of species in tree and their numeric translation
+    labels : dictionary, optional
+        labels of inner nodes (such as support) for some splits
+
+    Returns
+    -------
+    tree_text : string
+        tree with original names of species in newick format
+    """
+    taxa = species_mask(translated_taxa)
+    clades = [taxa]
+    children = {taxa: []}
+    for split in sorted(splits, key=lambda split: bin(split).count("1"),
+                        reverse=True):
+        #the latest placed clade containing split is the smallest one
+        parent = next(clade for clade in reversed(clades)
+                      if clade & split == split)
+        children[parent].append(split)
+        children[split] = []
+        clades.append(split)
+    for num in sorted(translated_taxa):
+        parent = next(clade for clade in reversed(clades)
+                      if clade >> num & 1)
+        children[parent].append(1 << num)
+    def newick(clade):
+        if clade not in children:
+            return(translated_taxa[clade.bit_length() - 1])
+        label = labels.get(clade, "") if labels else ""
+        return("(" + ",".join(newick(child) for child in sorted(
+            children[clade], key=lambda child: child & -child)) + ")" + label)
+    return(newick(taxa) + ";")
+
+
+def canonical_split(mask, taxa, rooted):
+    """Return species bitmask in the same form as splits from tree_splits,
+    or None if species are trivially monophyletic in every tree."""
+    if rooted:
+        return(None if mask == taxa else mask)
+    if mask & taxa & -taxa:
+        mask ^= taxa
+    rest = taxa ^ mask
+    if mask & (mask - 1) and rest & (rest - 1):
+        return(mask)
+    return(None)
+
+
+def split_table(trees, rooted, weights=None):
+    """Count every split in trees.
+
+    Parameters
+    ----------
+    trees : iterable of lists of ints
+        clades of trees, as returned by tree_clades or cached_tree_sample
+    rooted : bool
+        whether trees are rooted
+    weights : iterable of floats, optional
+        weight of every tree, every tree is counted once if not given
+
+    Returns
+    -------
+    table : Counter
+        number (or weight) of trees for every split found, see tree_splits
+    num_total : int or float
+        number (or weight) of trees
+    """
+    table = collections.Counter()
+    num_total = 0
+    if weights is None:
+        for clades in trees:
+            table.update(tree_splits(clades, rooted))
+            num_total += 1
+        return(table, num_total)
+    for clades, weight in itertools.izip(trees, weights):
+        for split in tree_splits(clades, rooted):
+            table[split] += weight
+        num_total += weight
+    return(table, num_total)
+
+
+def table_solution(table, num_total, species_groups, translated_taxa,
+                   rooted):
+    """Return number of monophyletic trees for every group of input species
+    by looking them up in split table.
+
+    Parameters
+    ----------
+    table : Counter
+        number of trees for every split, as returned by split_table
+    num_total : int
+        number of trees from which table was computed
+    species_groups : list of lists of strings
+        groups of species for monophyly, translated into numeric form
+    translated_taxa : dictionary
+        original names of species in trees and their numeric translation
+    rooted : bool
+        whether trees are rooted
+
+    Returns
+    -------
+    monophyletic_counters : list of ints
+        number of monophyletic trees for every group
+    """
+    taxa = species_mask(translated_taxa)
+    monophyletic_counters = []
+    for species in species_groups:
+        split = canonical_split(species_mask(species), taxa, rooted)
+        if split is None:
+            monophyletic_counters.append(num_total)
+        else:
+            monophyletic_counters.append(table[split])
+    return(monophyletic_counters)
+
+
+def majority_rule_splits(table, num_total, threshold=0.5):
+    """Return splits found in more than threshold of trees, as used for
+    majority-rule consensus, sorted from the most frequent one.
+
+    Returns
+    -------
+    splits : list of tuples
+        bitmask of split and its frequency
+    """
+    splits = [(split, count / num_total) for split, count in table.iteritems()
+              if count / num_total > threshold]
+    splits.sort(key=lambda item: item[1], reverse=True)
+    return(splits)
+
+
+def save_consensus(consensusfile, table, num_total, translated_taxa):
+    """Save majority-rule consensus tree made from split table (see
+    majority_rule_splits) in newick format, with frequency of every split as
+    label of its node."""
+    splits = majority_rule_splits(table, num_total)
+    labels = dict((split, "{0:.4g}".format(frequency))
+                  for split, frequency in splits)
+    with open(consensusfile, "w") as consensus_file:
+        consensus_file.write(splits_newick(
+            [split for split, frequency in splits], translated_taxa,
+            labels) + "\n")
+
+
+def mask_taxa(mask):
+    """Return list of numbers of taxa in bitmask."""
+    return([num for num in range(mask.bit_length()) if mask >> num & 1])
+
+
+def missing_species_error(species_groups, clades):
+    """Return error for groups with species missing in tree, with numbers
+    of missing species and of taxa in tree."""
+    taxa = set(mask_taxa(clades[-1]))
+    missing = sorted(set(int(species) for species_group in species_groups
+                         for species in species_group) - taxa)
+    return(RuntimeError("Species {0} are not in tree with taxa {1}. Error in"
+                        " translating?".format(
+                            ",".join(map(str, missing)),
+                            ",".join(map(str, sorted(taxa))))))
+
+
+def save_split_table(tablefile, table, translated_taxa, num_total, num_read,
+                     rooted):
+    """Save split table into tab-separated text file.
+
+    Header lines starting with "#" hold information required to use table
+    later, i.e., whether trees were rooted, number of trees read and after
+    burnin and Translate block. Every following line contains count of split
+    and numbers of its taxa separated by commas.
+    """
+    with open(tablefile, "w") as table_file:
+        table_file.write("#rooted\t{0}\n".format(int(rooted)))
+        table_file.write("#read\t{0}\n".format(num_read))
+        table_file.write("#total\t{0}\n".format(num_total))
+        for key, value in sorted(translated_taxa.items()):
+            table_file.write("#taxon\t{0}\t{1}\n".format(key, value))
+        for split, count in table.most_common():
+            table_file.write("{0}\t{1}\n".format(
+                count, ",".join(str(num) for num in mask_taxa(split))
+                ))
+
+
+def parse_count(text):
+    """Return number of trees, which is float for weighted trees."""
+    try:
+        return(int(text))
+    except ValueError:
+        return(float(text))
+
+
+def load_split_table(tablefile):
+    """Load split table saved with save_split_table.
+
+    Returns
+    -------
+    table : Counter
+        number of trees for every split
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    num_total : int
+        number of trees from which table was computed
+    num_read : int
+        number of trees read, including burnin
+    rooted : bool
+        whether trees were rooted
+    """
+    table = collections.Counter()
+    translated_taxa = dict()
+    header = dict()
+    try:
+        table_file = open(tablefile, "r")
+    except IOError:
+        raise ParsingError("Couldn't open file, does file exists?")
+    with table_file:
+        for line in table_file:
+            fields = line.rstrip("\n").split("\t")
+            if fields[0] == "#taxon":
+                translated_taxa[int(fields[1])] = fields[2]
+            elif fields[0].startswith("#"):
+                header[fields[0][1:]] = parse_count(fields[1])
+            else:
+                table[species_mask(fields[1].split(","))] = parse_count(
+                    fields[0])
+    if not translated_taxa or len(header) != 3:
+        raise ParsingError("Misformed split table.")
+    return(table, translated_taxa, header["total"], header["read"],
+           bool(header["rooted"]))
+
+
+class TopologyStore(object):
+    """Distinct topologies of tree sample in compact form.
+
+    Every topology is stored as parent indices of its nodes and parent
+    indices of all topologies are held in single flat array, so that
+    topology takes two bytes per node instead of Python integer for every
+    clade. Nodes are numbered canonically: first taxa in order of their
+    numbers, then clades in order of their bitmasks, so that the root is the
+    last node and its parent is not stored. Every clade is therefore
+    numbered after its children and the same topology always gives the same
+    parent indices, which are used to find repeated topologies.
+
+    Parameters
+    ----------
+    taxa : iterable of ints
+        numbers of taxa from the Translate block
+    """
+    def __init__(self, taxa):
+        self.taxa = sorted(taxa)
+        self.leaf_index = {1 << taxon: leaf
+                           for leaf, taxon in enumerate(self.taxa)}
+        self.typecode = "H" if 2 * len(self.taxa) < 1 << 16 else "I"
+        self.parents = array.array(self.typecode)
+        self.offsets = array.array("L", [0])
+        self.index = dict()
+
+    def __len__(self):
+        return(len(self.offsets) - 1)
+
+    def add(self, clades):
+        """Add topology given by its clades in the order of tree_clades,
+        unless it is already stored, and return its index."""
+        num_taxa = len(self.taxa)
+        rank = [0] * len(clades)
+        for node, old in enumerate(sorted(range(len(clades)),
+                                          key=clades.__getitem__)):
+            rank[old] = node
+        #parent of taxon missing from tree stays 0, which is never a clade
+        parents = array.array(self.typecode,
+                              [0] * (num_taxa + len(clades) - 1))
+        stack = []
+        for old, clade in enumerate(clades):
+            node = num_taxa + rank[old]
+            #children of clade are the last finished clades that it contains
+            leaves = clade
+            while stack and stack[-1][0] & clade == stack[-1][0]:
+                (child, child_old) = stack.pop()
+                parents[num_taxa + rank[child_old]] = node
+                leaves ^= child
+            while leaves:
+                leaf = leaves & -leaves
+                try:
+                    parents[self.leaf_index[leaf]] = node
+                except KeyError:
+                    raise RuntimeError("Taxon is not in Translate block!")
+                leaves ^= leaf
+            stack.append((clade, old))
+        key = hashlib.sha1(parents.tostring()).digest()
+        index = self.index.get(key)
+        if index is None:
+            index = self.index[key] = len(self)
+            self.parents.extend(parents)
+            self.offsets.append(len(self.parents))
+        return(index)
+
+    def __getitem__(self, index):
+        """Return clades of topology as sorted Clades, the root being the
+        last."""
+        num_taxa = len(self.taxa)
+        parents = self.parents[self.offsets[index]:self.offsets[index + 1]]
+        masks = [0] * (len(parents) - num_taxa + 1)
+        for taxon, parent in itertools.izip(self.taxa, parents):
+            if parent:
+                masks[parent - num_taxa] |= 1 << taxon
+        for node in range(len(masks) - 1):
+            masks[parents[num_taxa + node] - num_taxa] |= masks[node]
+        return(Clades(masks))
+
+    def __iter__(self):
+        return(self[index] for index in range(len(self)))
+
+
+CACHE_SUFFIX = ".bmcache"
+CACHE_HEADER = "BayesMonophyly cache 3\n"
+
+
+def cached_tree_sample(treefile, build=True, memo_size=MEMO_SIZE):
+    """Return tree sample, read from cache file if possible.
+
+    Parsing of large tree files is slow, so every parsed file is saved into
+    binary cache file next to it (with suffix CACHE_SUFFIX). Cache holds
+    Translate block, every distinct topology in compact form (see
+    TopologyStore) and topology of every tree as index of this topology.
+    Cache is used only if path, size, modification time and SHA1 hash of
+    tree file did not change, otherwise tree file is parsed again and cache
+    is rewritten. If cache can't be written, sample is just returned.
+
+    Parameters
+    ----------
+    treefile : string
+        path to file with posterior tree sample
+    build : bool
+        if False and there is no valid cache, None is returned instead of
+        parsing tree file
+    memo_size : int
+        memory for repeated trees while tree file is parsed in bytes (see
+        TopologyMemo)
+
+    Returns
+    -------
+    translated_taxa : dictionary
+        original names of species in file and their numeric translation
+    topologies : TopologyStore
+        every distinct topology, indexing gives its sorted clades
+    tree_topologies : array of ints
+        index of topology of every tree, in order of file
+    """
+    cachefile = treefile + CACHE_SUFFIX
+    key = tree_file_key(treefile)
+    try:
+        with profiler.stage("cache"):
+            sample = load_cache(cachefile, key, treefile)
+            profiler.add_trees("cache", len(sample[2]))
+            return(sample)
+    except (IOError, EOFError, ValueError, TypeError, KeyError):
+        if not build:
+            return(None)
+    (translated_taxa, topologies, tree_topologies) = parse_tree_sample(
+        treefile, memo_size)
+    with profiler.stage("cache"):
+        key["sha1"] = tree_file_hash(treefile)
+        try:
+            save_cache(cachefile, key, translated_taxa, topologies,
+                       tree_topologies)
+        except (IOError, OSError):
+            pass
+    return(translated_taxa, topologies, tree_topologies)
+
+
+def parse_tree_sample(treefile, memo_size=MEMO_SIZE):
+    """Parse tree file into tree sample in the same form as is held in cache
+    (see cached_tree_sample), without reading or writing cache. Repeated
+    trees are added to sample only once, as long as they fit into memo of
+    memo_size bytes."""
+    (translated_taxa, trees) = parse_tree_file(treefile)
+    with profiler.stage("cache"):
+        topologies = TopologyStore(translated_taxa)
+        tree_topologies = array.array("I")
+        memo = TopologyMemo(memo_size)
+        for tree in trees:
+            tree_topologies.append(memo.evaluate(
+                tree, lambda tree: topologies.add(tree_clades(tree))))
+        profiler.add_trees("cache", len(tree_topologies))
+    return(translated_taxa, topologies, tree_topologies)
+
+
+def burned_trees(treefile, sample, burnin, thin, memo, text_trees=False,
+                 offsets=None):
+    """Return every thin-th tree after burnin of tree file, either from
+    cached sample (see cached_tree_sample) or parsed from file, as clades or,
+    with text_trees, as cladograms in text form (sample must be None). With
+    byte offsets of trees (see index_tree_file), only lines of these trees
+    are read."""
+    if sample is not None:
+        return(profiler.timed(cached_trees(sample, burnin, thin,
+                                           memo_size=memo.maxsize), "clades"))
+    if offsets is not None:
+        tree_lines = profiler.timed(read_strided_lines(
+            treefile, offsets, burnin, thin), "read")
+        trees = profiler.timed((strip_tree(line) for line in tree_lines),
+                               "strip")
+    else:
+        trees = parse_tree_file(treefile, burnin, thin)[1]
+    if text_trees:
+        return(trees)
+    return(profiler.timed(itertools.imap(
+        lambda tree: memo.evaluate(tree, tree_clades), trees), "clades"))
+
+
+def cached_trees(sample, burnin, thin=1, end=None, memo_size=MEMO_SIZE):
+    """Yield clades of every thin-th tree after burnin (and before end, if
+    given) from tree sample returned by cached_tree_sample, in order of
+    trees. Clades are rebuilt from compact form of topology only for
+    topologies that were not seen recently (see TopologyMemo with budget
+    of memo_size bytes). When order of trees is not needed, use
+    cached_topologies or cached_solution instead, which rebuild every
+    distinct topology only once and do not keep it."""
+    (translated_taxa, topologies, tree_topologies) = sample
+    memo = TopologyMemo(memo_size)
+    for index in itertools.islice(tree_topologies, burnin, end, thin):
+        yield memo.evaluate(index, topologies.__getitem__)
+
+
+def cached_topologies(sample, burnin, thin=1, end=None):
+    """Return clades of every distinct topology among every thin-th tree
+    after burnin (and before end, if given) from tree sample returned by
+    cached_tree_sample, and number of these trees with every topology.
+
+    Returns
+    -------
+    clades : generator of Clades
+        clades of distinct topologies, rebuilt from compact form only when
+        they are used, so that they are not held in memory all at once
+    counts : list of ints
+        number of trees of every distinct topology
+    tree_topologies : array of ints
+        position of topology of every tree in distinct topologies, in
+        order of trees
+    """
+    (translated_taxa, topologies, tree_topologies) = sample
+    position = dict()
+    counts = []
+    used_topologies = array.array("I")
+    for index in itertools.islice(tree_topologies, burnin, end, thin):
+        num = position.get(index)
+        if num is None:
+            num = position[index] = len(counts)
+            counts.append(0)
+        counts[num] += 1
+        used_topologies.append(num)
+    distinct = sorted(position, key=position.get)
+    clades = profiler.timed((topologies[index] for index in distinct),
+                            "clades")
+    return(clades, counts, used_topologies)
+
+
+def cached_solution(sample, burnin, thin, species_groups, rooted,
+                    engine="bitset", batch_means=None, end=None,
+                    keep_indicators=False):
+    """Return number of monophyletic trees for every group in every thin-th
+    tree after burnin (and before end, if given) from tree sample returned
+    by cached_tree_sample.
+
+    Every distinct topology is tested only once, with its number of trees
+    as weight (see cached_topologies), so that no topology is evaluated
+    twice and clades of topologies are not kept in memory. If batch_means
+    is given (or keep_indicators with "numpy" engine, see numpy_solution),
+    only monophyly of every distinct topology is kept and monophyly of
+    every tree is then taken from it in order of trees.
+    """
+    (clades, counts, tree_topologies) = cached_topologies(sample, burnin,
+                                                          thin, end)
+    solution = numpy_solution if engine == "numpy" else bitset_solution
+    if batch_means is None and not keep_indicators:
+        return(solution(clades, species_groups, rooted, counts))
+    (monophyletic_counters, indicators) = solution(
+        clades, species_groups, rooted, counts, keep_indicators=True)
+    if engine != "numpy":
+        if batch_means is not None:
+            for num in tree_topologies:
+                batch_means.add(indicators[num])
+        return(monophyletic_counters)
+    import numpy
+    indicators = indicators[:, numpy.array(tree_topologies, dtype=int)]
+    if batch_means is not None:
+        batch_means.add_indicators(indicators)
+    if keep_indicators:
+        return(monophyletic_counters, indicators)
+    return(monophyletic_counters)
+
+
+def tree_file_key(treefile):
+    """Return path, size and modification time of file, which are used
+    to find out if cache is stale."""
+    try:
+        stat = os.stat(treefile)
+    except OSError:
+        raise ParsingError("Couldn't open file, does file exists?")
+    return({"path": os.path.abspath(treefile), "size": stat.st_size,
+            "mtime": stat.st_mtime})
+
+
+def tree_file_hash(treefile):
+    """Return SHA1 hash of content of file."""
+    sha1 = hashlib.sha1()
+    with open(treefile, "rb") as tree_file:
+        for chunk in iter(lambda: tree_file.read(1 << 20), ""):
+            sha1.update(chunk)
+    return(sha1.hexdigest())
+
+
+def save_cache(cachefile, key, translated_taxa, topologies, tree_topologies):
+    """Save parsed tree sample into binary cache file.
+
+    File starts with CACHE_HEADER and JSON line with key of tree file and
+    Translate block, followed by arrays of topologies (see TopologyStore)
+    and array of topologies of trees. Cache is written into temporary file
+    of its own in the same directory first and then renamed, so that
+    interrupted run never leaves incomplete cache behind and processes
+    saving cache of the same file at once don't write into the same file.
+    """
+    import tempfile
+    header = dict(key)
+    header["taxa"] = sorted(translated_taxa.items())
+    header["trees"] = len(tree_topologies)
+    header["topologies"] = len(topologies)
+    header["nodes"] = len(topologies.parents)
+    (handle, temp_path) = tempfile.mkstemp(
+        suffix=".tmp", prefix=os.path.basename(cachefile) + ".",
+        dir=os.path.dirname(cachefile) or ".")
+    try:
+        with os.fdopen(handle, "wb") as cache_file:
+            cache_file.write(CACHE_HEADER)
+            cache_file.write(json.dumps(header) + "\n")
+            topologies.offsets.tofile(cache_file)
+            topologies.parents.tofile(cache_file)
+            tree_topologies.tofile(cache_file)
+        #mkstemp creates file readable only by its owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_path, 0o666 & ~umask)
+        os.rename(temp_path, cachefile)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def load_cache(cachefile, key, treefile):
+    """Load tree sample from cache file saved by save_cache.
+
+    Raises IOError if cache does not exist or does not belong to tree file
+    identified by key (see tree_file_key).
+    """
+    with open(cachefile, "rb") as cache_file:
+        if cache_file.readline() != CACHE_HEADER:
+            raise IOError("Unknown cache format.")
+        header = json.loads(cache_file.readline())
+        if any(header[item] != value for item, value in key.iteritems()):
+            raise IOError("Cache is stale.")
+        #hash is checked only when cheaper checks passed
+        if header["sha1"] != tree_file_hash(treefile):
+            raise IOError("Cache is stale.")
+        translated_taxa = {int(num): str(name)
+                           for num, name in header["taxa"]}
+        topologies = TopologyStore(translated_taxa)
+        topologies.offsets = array.array("L")
+        topologies.offsets.fromfile(cache_file, header["topologies"] + 1)
+        topologies.parents.fromfile(cache_file, header["nodes"])
+        tree_topologies = array.array("I")
+        tree_topologies.fromfile(cache_file, header["trees"])
+    return(translated_taxa, topologies, tree_topologies)
+
+
+def parse_groups_file(groupsfile):
+    """Parse file with groups of species to be tested for monophyly.
+
+    Every line contains one group of species separated by whitespace or
+    commas. Group can be named by prefixing it with name and colon, such as
+    "apes: Pan Homo Gorilla", otherwise it is named by its line number.
+    Empty lines and lines starting with "#" are ignored.
+
+    Parameters
+    ----------
+    groupsfile : string
+        path to file with groups of species
+
+    Returns
+    -------
+    groups : list of tuples
+        name of group and list of its species
+    """
+    groups = []
+    try:
+        groups_file = open(groupsfile, "r")
+    except IOError:
+        raise ParsingError("Couldn't open file, does file exists?")
+    with groups_file:
+        for num, line in enumerate(groups_file):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if ":" in line:
+                (name, line) = line.split(":", 1)
+                name = name.strip()
+            else:
+                name = "group_{0}".format(num + 1)
+            groups.append((name, line.replace(",", " ").split()))
+    if not groups:
+        raise ParsingError("No group of species found in file.")
+    return(groups)
+
+
+def check_species_group(species):
+    """Check that group has at least two species and that they are unique."""
+    #analysis makes sense only for 2 and more species:
+    if len(species) < 2:
+        raise ValueError("Must specify at least 2 species.")
+    #also, the species must be different:
+    if len(set(species)) < len(species):
+        raise ValueError("Please, make sure that species are unique.")
+
+
+def memoize(function):
+    """Remember results of function for every combination of arguments."""
+    results = dict()
+    @functools.wraps(function)
+    def memoized(*args):
+        try:
+            return(results[args])
+        except KeyError:
+            result = results[args] = function(*args)
+            return(result)
+    return(memoized)
+
+
+@memoize
+def log_n_unrooted_trees(n):
+    """Returns natural logarithm of number of unrooted trees for n taxa.
+
+    Number of unrooted trees is double factorial (2n-5)!!, which is computed
+    with lgamma as log((2n-5)!) - (n-3)log(2) - log((n-3)!), so that no
+    large number is ever created.
+    """
+    if n <= 3:
+        return(0.0)
+    return(math.lgamma(2*n-4) - (n-3)*math.log(2) - math.lgamma(n-2))
+
+
+@memoize
+def log_n_rooted_trees(n):
+    """Returns natural logarithm of number of rooted trees for n taxa, i.e.,
+    log((2n-3)!!), see log_n_unrooted_trees."""
+    if n <= 2:
+        return(0.0)
+    return(math.lgamma(2*n-2) - (n-2)*math.log(2) - math.lgamma(n-1))
+
+
+def n_unrooted_trees(n):
+    """Returns number of unrooted trees for n taxa."""
+    return math.factorial(2*n-5) // (2**(n-3) * math.factorial(n-3))
+
+
+def n_rooted_trees(n):
+    """Returns number of rooted trees for n taxa."""
+    return math.factorial(2*n-3) // (2**(n-2) * math.factorial(n-2))
+
+
+def log1m_exp(x):
+    """Return log(1 - exp(x)) for negative x without loss of precision,
+    both for x close to zero and for very small exp(x)."""
+    if x > -math.log(2):
+        return(math.log(-math.expm1(x)))
+    return(math.log1p(-math.exp(x)))
+
+
+def log_bayes_factor(log_prior, posterior):
+    """Compute natural logarithm of standard Bayes factor, i.e., of ratio of
+    posterior and prior odds of monophyly.
+
+    Prior odds are computed from logarithm of prior (see compute_log_prior),
+    so that Bayes factor is correct also for prior too small to be stored
+    as float. Posterior zero gives minus infinity and posterior one
+    infinity.
+    """
+    if posterior == 0:
+        return(float("-inf"))
+    if posterior == 1:
+        return(float("inf"))
+    return(math.log(posterior) - math.log1p(-posterior) - log_prior +
+           log1m_exp(log_prior))
+
+
+def bayes_factor(log_prior, posterior):
+    """Compute standard Bayes factor from logarithm of prior and posterior
+    (see log_bayes_factor), infinity if it is too large for float."""
+    try:
+        return(math.exp(log_bayes_factor(log_prior, posterior)))
+    except OverflowError:
+        return(float("inf"))
+
+
+def compute_log_prior(num_taxa, num_species, rooted, exact=False):
+    """Compute natural logarithm of prior probability for trees, either
+    rooted or unrooted.
+
+    Prior is ratio of number of trees in which species are monophyletic to
+    number of all trees. Numbers of trees are computed in log space (see
+    log_n_unrooted_trees), so that prior is numerically stable even for
+    thousands of taxa. With exact, numbers of trees are computed as exact
+    integers, which is slow for many taxa and is intended only for
+    validation. Raises ValueError if prior is one.
+    """
+    if not exact:
+        if rooted:
+            log_prior = (log_n_rooted_trees(num_taxa-num_species+1) +
+                         log_n_rooted_trees(num_species) -
+                         log_n_rooted_trees(num_taxa))
+        else:
+            log_prior = (log_n_unrooted_trees(num_taxa-num_species+1) +
+                         log_n_rooted_trees(num_species) -
+                         log_n_unrooted_trees(num_taxa))
+    elif rooted:
+        log_prior = (math.log(n_rooted_trees(num_taxa-num_species+1) *
+                              n_rooted_trees(num_species)) -
+                     math.log(n_rooted_trees(num_taxa)))
+    else:
+        log_prior = (math.log(n_unrooted_trees(num_taxa-num_species+1) *
+                              n_rooted_trees(num_species)) -
+                     math.log(n_unrooted_trees(num_taxa)))
+    #Bayes factor is not defined for species that are monophyletic in every
+    #tree
+    if log_prior >= 0:
+        raise ValueError("Prior is one.")
+    return(log_prior)
+
+
+def compute_prior(num_taxa, num_species, rooted, exact=False):
+    """Compute prior probability for trees, either rooted or unrooted, as
+    exponential of compute_log_prior. Prior of large groups among many taxa
+    is too small for float and is zero, use compute_log_prior for it."""
+    return(math.exp(compute_log_prior(num_taxa, num_species, rooted, exact)))
+
+
+PRIOR_MODELS = ["uniform", "yule", "coalescent"]
+
+
+def simulate_monophyly(task):
+    """Simulate random topologies and count those in which the group of
+    species is monophyletic.
+
+    Only numbers of lineages are simulated, as prior does not depend on
+    which taxa are in the group. Under the uniform model, taxa of the group
+    are added first and every other taxon is attached to random branch of
+    rooted tree, group stays monophyletic unless taxon is attached inside of
+    it. Unrooted tree is rooted on taxon outside of group, so that it is
+    rooted tree with one taxon less. Under the Yule and coalescent models,
+    random pairs of lineages are joined, as both models give the same
+    distribution of ranked topologies. Group is monophyletic if its lineages
+    are joined into one before they are joined with any other lineage or,
+    for unrooted trees, if the same happens for other lineages.
+
+    Topologies are simulated in batch as arrays by NumPy if it is installed,
+    otherwise one by one. The same seed gives the same result only with the
+    same of the two.
+
+    Parameters
+    ----------
+    task : tuple
+        number of taxa, number of species in group, whether trees are
+        rooted, model, number of topologies and seed
+
+    Returns
+    -------
+    num_monophyletic : int
+        number of topologies in which group is monophyletic
+    """
+    (num_taxa, num_species, rooted, model, num_samples, seed) = task
+    if num_species >= num_taxa:
+        return(num_samples)
+    if model == "uniform" and not rooted:
+        num_taxa -= 1
+        rooted = True
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+    if numpy is not None:
+        rng = numpy.random.RandomState(seed % 2**32)
+        if model == "uniform":
+            monophyletic = numpy.ones(num_samples, dtype=bool)
+            for num in range(num_species, num_taxa):
+                #rooted tree of num taxa has 2num-1 branches with the root
+                #branch, 2num_species-2 of them are inside of group
+                branches = rng.randint(0, 2*num - 1, size=num_samples)
+                monophyletic &= branches >= 2*num_species - 2
+            return(int(monophyletic.sum()))
+        in_group = numpy.full(num_samples, num_species)
+        others = numpy.full(num_samples, num_taxa - num_species)
+        monophyletic = numpy.zeros(num_samples, dtype=bool)
+        joining = numpy.ones(num_samples, dtype=bool)
+        for lineages in range(num_taxa, 1, -1):
+            pairs = rng.randint(0, lineages*(lineages - 1) // 2,
+                                size=num_samples)
+            group_pairs = in_group*(in_group - 1) // 2
+            other_pairs = group_pairs + others*(others - 1) // 2
+            mixed = joining & (pairs >= other_pairs)
+            finished = in_group == 1
+            if not rooted:
+                finished |= others == 1
+            monophyletic |= mixed & finished
+            joining &= ~mixed
+            in_group -= joining & (pairs < group_pairs)
+            others -= joining & (pairs >= group_pairs) & (pairs < other_pairs)
+        return(int(monophyletic.sum()))
+    rng = random.Random(seed)
+    num_monophyletic = 0
+    for sample in range(num_samples):
+        if model == "uniform":
+            num_monophyletic += all(
+                rng.randrange(2*num - 1) >= 2*num_species - 2
+                for num in range(num_species, num_taxa))
+            continue
+        (in_group, others) = (num_species, num_taxa - num_species)
+        while True:
+            pair = rng.randrange((in_group + others) *
+                                 (in_group + others - 1) // 2)
+            if pair < in_group*(in_group - 1) // 2:
+                in_group -= 1
+            elif pair < (in_group*(in_group - 1) // 2 +
+                         others*(others - 1) // 2):
+                others -= 1
+            else:
+                num_monophyletic += (in_group == 1 or
+                                     (not rooted and others == 1))
+                break
+    return(num_monophyletic)
+
+
+@memoize
+def simulate_prior(num_taxa, num_species, rooted, model, num_samples,
+                   seed, jobs=1):
+    """Estimate prior probability of monophyly by simulation of random
+    topologies under model (see simulate_monophyly).
+
+    Simulation is split into batches with seeds derived from seed, which
+    are run in pool of jobs worker processes. Result is remembered for
+    every number of taxa, size of group and model, so that groups of the
+    same size are simulated only once. Raises ValueError if prior is one,
+    as compute_log_prior, or zero, i.e. too small to be estimated.
+    """
+    batch_size = 100000
+    tasks = [(num_taxa, num_species, rooted, model,
+              min(batch_size, num_samples - start), seed * 1000003 + num)
+             for num, start in enumerate(range(0, num_samples, batch_size))]
+    if jobs > 1 and len(tasks) > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(simulate_monophyly, tasks, chunksize=1)
+        finally:
+            pool.terminate()
+    else:
+        results = [simulate_monophyly(task) for task in tasks]
+    prior = sum(results) / num_samples
+    if prior == 1:
+        raise ValueError("Prior is one.")
+    if prior == 0:
+        raise ValueError("Prior is zero.")
+    return(prior)
+
+
+def get_log_prior_function(model=None, exact=False, num_samples=1000000,
+                           seed=0, jobs=1):
+    """Return function of number of taxa, number of species in group and
+    rootedness, which computes natural logarithm of prior either in closed
+    form (compute_log_prior) or, if model is given, by simulation
+    (simulate_prior)."""
+    if model is None:
+        return(lambda num_taxa, num_species, rooted:
+               compute_log_prior(num_taxa, num_species, rooted, exact))
+    return(lambda num_taxa, num_species, rooted:
+           math.log(simulate_prior(num_taxa, num_species, rooted, model,
+                                   num_samples, seed, jobs)))
+
+
+def compute_posterior(num_monophyletic, num_total):
+    """Compute posterior probability of monophyletic trees."""
+    posterior = num_monophyletic / num_total
+    #posterior 0 can happen and is legitimate
+    #posterior 1 however destroys bayes factor (division by zero)
+    if posterior == 1:
+        raise ValueError("Posterior is one")
+    return(posterior)
+
+
+class BatchMeans(object):
+    """Monte Carlo standard error of posterior by the method of batch means.
+
+    Trees are consecutive samples of MCMC, so they are autocorrelated and
+    posterior is less precise than if they were independent. Sequence of
+    num_trees trees is split into num_batches consecutive batches of the
+    same size and only number of monophyletic trees in every batch is kept
+    for every group, so that memory does not depend on number of trees.
+    Variance of means of batches then estimates error of posterior. Trees
+    after the last whole batch are not used for the error.
+
+    Parameters
+    ----------
+    num_groups : int
+        number of groups of species
+    num_trees : int
+        number of trees in whole sequence
+    num_batches : int
+        number of batches
+    position : int
+        position of the first added tree in sequence
+    """
+    def __init__(self, num_groups, num_trees, num_batches=30, position=0):
+        self.num_trees = num_trees
+        self.num_batches = min(num_batches, num_trees)
+        self.size = max(1, num_trees // num_batches)
+        self.position = position
+        self.sums = [[0] * self.num_batches for group in range(num_groups)]
+
+    def add(self, monophyletic):
+        """Add next tree, given its monophyly for every group."""
+        batch = self.position // self.size
+        self.position += 1
+        if batch < self.num_batches:
+            for sums, value in itertools.izip(self.sums, monophyletic):
+                if value:
+                    sums[batch] += 1
+
+    def add_indicators(self, indicators):
+        """Add next trees, given NumPy matrix of their monophyly for every
+        group, either of batch of trees (see monophyly_indicators) or of
+        whole sequence of trees (see numpy_solution)."""
+        import numpy
+        num_trees = indicators.shape[1]
+        batches = numpy.arange(self.position,
+                               self.position + num_trees) // self.size
+        self.position += num_trees
+        used = batches < self.num_batches
+        for sums, indicator in zip(self.sums, indicators):
+            counts = numpy.bincount(batches[used], weights=indicator[used],
+                                    minlength=self.num_batches)
+            for batch, count in enumerate(counts[:self.num_batches]):
+                sums[batch] += int(count)
+
+    def update(self, other):
+        """Add counts of other BatchMeans for the same sequence of trees,
+        such as for trees evaluated in another process."""
+        for sums, other_sums in zip(self.sums, other.sums):
+            for batch, count in enumerate(other_sums):
+                sums[batch] += count
+
+    def standard_error(self, group):
+        """Return Monte Carlo standard error of posterior of group, or None
+        if there are less than two batches."""
+        if self.num_batches < 2:
+            return(None)
+        means = [count / self.size for count in self.sums[group]]
+        mean = sum(means) / self.num_batches
+        variance = (sum((batch_mean - mean)**2 for batch_mean in means) /
+                    (self.num_batches - 1))
+        return(math.sqrt(variance / self.num_batches))
+
+
+def effective_sample_size(posterior, standard_error):
+    """Return number of independent trees, which would give the same
+    standard error of posterior."""
+    if standard_error == 0:
+        return(float("inf"))
+    return(posterior * (1 - posterior) / standard_error**2)
+
+
+def bayes_factor_interval(log_prior, posterior, standard_error, z=1.96):
+    """Return approximate 95% confidence interval of Bayes factor.
+
+    Bayes factor increases with posterior, so interval is given by Bayes
+    factors of bounds of normal confidence interval of posterior, which are
+    limited to range from zero to one.
+    """
+    bounds = (max(0, posterior - z * standard_error),
+              posterior + z * standard_error)
+    return(tuple(float("inf") if bound >= 1
+                 else bayes_factor(log_prior, bound) for bound in bounds))
+
+
+def format_error(posterior, standard_error, log_prior=None):
+    """Format standard error of posterior, effective sample size and, if
+    logarithm of prior is given, confidence interval of Bayes factor, as
+    "NA" if error is not known."""
+    if standard_error is None:
+        return(["NA"] * (2 if log_prior is None else 4))
+    values = [standard_error, effective_sample_size(posterior,
+                                                    standard_error)]
+    if log_prior is not None:
+        values.extend(bayes_factor_interval(log_prior, posterior,
+                                            standard_error))
+    return(["{0:.4g}".format(value) for value in values])
+
+
+class MonophylyResult(object):
+    """Result of test of monophyly of one group of species.
+
+    Attributes
+    ----------
+    name : string
+        name of group
+    species : list of strings
+        species in group
+    num_monophyletic : int or float
+        number (or weight) of trees in which group is monophyletic
+    num_total : int or float
+        number (or weight) of all trees
+    log_prior : float or None
+        natural logarithm of prior probability of monophyly, None if it
+        can't be computed (see compute_log_prior)
+    standard_error : float or None
+        Monte Carlo standard error of posterior (see BatchMeans), None if
+        it is not known
+    indicators : numpy array of bools or None
+        monophyly of group in every tree in order of trees, if it was kept
+        (see numpy_solution)
+    num_read : int or None
+        number of trees read including burnin (number of distinct trees for
+        weighted trees), if it is known (see monophyly_analysis)
+    """
+    def __init__(self, name, species, num_monophyletic, num_total,
+                 log_prior=None, standard_error=None, indicators=None):
+        self.name = name
+        self.species = species
+        self.num_monophyletic = num_monophyletic
+        self.num_total = num_total
+        self.log_prior = log_prior
+        self.standard_error = standard_error
+        self.indicators = indicators
+        self.num_read = None
+
+    @property
+    def posterior(self):
+        return(self.num_monophyletic / self.num_total)
+
+    @property
+    def prior(self):
+        """Prior probability of monophyly, zero if it is too small for
+        float."""
+        if self.log_prior is None:
+            return(None)
+        return(math.exp(self.log_prior))
+
+    @property
+    def expected(self):
+        """Number (or weight) of monophyletic trees expected from prior."""
+        if self.prior is None:
+            return(None)
+        if isinstance(self.num_total, float):
+            return(self.prior * self.num_total)
+        return(int(round(self.prior * self.num_total)))
+
+    @property
+    def log_bayes_factor(self):
+        """Natural logarithm of Bayes factor, see log_bayes_factor."""
+        if self.log_prior is None:
+            return(None)
+        return(log_bayes_factor(self.log_prior, self.posterior))
+
+    @property
+    def bayes_factor(self):
+        """Bayes factor, infinite if posterior is one or if it is too large
+        for float."""
+        if self.log_prior is None:
+            return(None)
+        return(bayes_factor(self.log_prior, self.posterior))
+
+    @property
+    def effective_sample_size(self):
+        if self.standard_error is None:
+            return(None)
+        return(effective_sample_size(self.posterior, self.standard_error))
+
+    @property
+    def bayes_factor_interval(self):
+        """Approximate 95% confidence interval of Bayes factor."""
+        if self.log_prior is None or self.standard_error is None:
+            return(None)
+        return(bayes_factor_interval(self.log_prior, self.posterior,
+                                     self.standard_error))
+
+    def as_dict(self):
+        """Return result as dictionary, e.g. for JSON."""
+        interval = self.bayes_factor_interval or (None, None)
+        return({"group": self.name, "species": self.species,
+                "monophyletic": self.num_monophyletic,
+                "total": self.num_total, "expected": self.expected,
+                "prior": self.prior, "posterior": self.posterior,
+                "bayes_factor": self.bayes_factor,
+                "log_bayes_factor": self.log_bayes_factor,
+                "posterior_mcse": self.standard_error,
+                "ess": self.effective_sample_size,
+                "bayes_factor_lower": interval[0],
+                "bayes_factor_upper": interval[1]})
+
+
+def json_value(value):
+    """Return value (also list or dictionary of values) that can be saved
+    as standard JSON. Infinite floats, such as Bayes factor of group
+    monophyletic in every tree, are replaced by strings "inf" and "-inf"
+    (as in CSV) and NaN by None."""
+    if isinstance(value, dict):
+        return(dict((key, json_value(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple)):
+        return([json_value(item) for item in value])
+    if isinstance(value, float) and (math.isinf(value) or
+                                     math.isnan(value)):
+        return(None if math.isnan(value) else str(value))
+    return(value)
+
+
+def monophyly_results(groups, monophyletic_counters, num_total, num_taxa,
+                      rooted, log_prior_function=compute_log_prior,
+                      batch_means=None, indicators=None):
+    """Return MonophylyResult for every group of species.
+
+    Logarithm of prior is computed by log_prior_function (see
+    get_log_prior_function) and it is None for special cases, in which it
+    can't be computed. If batch_means is given, standard error of posterior
+    is taken from it. If matrix of indicators of monophyly of every group in
+    every tree is given (see numpy_solution), every result gets its row.
+    """
+    results = []
+    for num, ((name, species), num_monophyletic) in enumerate(zip(
+            groups, monophyletic_counters)):
+        try:
+            log_prior = log_prior_function(num_taxa, len(species), rooted)
+        except ValueError:
+            log_prior = None
+        standard_error = None
+        if batch_means is not None:
+            standard_error = batch_means.standard_error(num)
+        results.append(MonophylyResult(
+            name, species, num_monophyletic, num_total, log_prior,
+            standard_error, None if indicators is None else indicators[num]))
+    return(results)
+
+
+def wilson_interval(num_monophyletic, num_total, z=1.96):
+    """Return approximate 95% confidence interval of posterior from
+    independent trees. Wilson score interval is used, as it is reasonable
+    also for posterior zero or one."""
+    if num_total == 0:
+        return(0.0, 1.0)
+    posterior = num_monophyletic / num_total
+    denominator = 1 + z**2 / num_total
+    center = (posterior + z**2 / (2 * num_total)) / denominator
+    half_width = z * math.sqrt(posterior * (1 - posterior) / num_total +
+                               z**2 / (4 * num_total**2)) / denominator
+    return(max(0, center - half_width), min(1, center + half_width))
+
+
+def sequential_rounds(num_trees, min_trees=100):
+    """Return rounds of sequential reading of num_trees trees.
+
+    Every round is given by position of its first tree and step between its
+    trees. The first round takes every stride-th tree, so that it has at
+    least min_trees trees, and every following round takes trees halfway
+    between trees of all previous rounds, so that number of trees used
+    doubles and trees are always spread over whole sample. All rounds
+    together take every tree exactly once.
+    """
+    stride = 1
+    while num_trees // (2 * stride) >= min_trees:
+        stride *= 2
+    rounds = [(0, stride)]
+    while stride > 1:
+        rounds.append((stride // 2, stride))
+        stride //= 2
+    return(rounds)
+
+
+def sequential_solution(read_round, num_trees, solution, tolerance):
+    """Evaluate trees in rounds until posterior of every group is known
+    precisely enough.
+
+    Trees are read in strided rounds (see sequential_rounds) and reading
+    stops when 95% confidence interval of posterior (see wilson_interval) of
+    every group is narrower than tolerance. Trees of strided rounds are far
+    apart in chain, so they are treated as independent.
+
+    Parameters
+    ----------
+    read_round : function
+        returns trees at given position and step in sequence of trees
+    num_trees : int
+        number of trees in sequence
+    solution : function
+        returns number of monophyletic trees for every group in trees
+    tolerance : float
+        required width of confidence interval of posterior
+
+    Returns
+    -------
+    monophyletic_counters : list of ints
+        number of monophyletic trees for every group in trees used
+    num_used : int
+        number of trees used
+    """
+    monophyletic_counters = None
+    num_used = 0
+    for start, step in sequential_rounds(num_trees):
+        counted = [0]
+        def counted_trees(trees):
+            for tree in trees:
+                counted[0] += 1
+                yield tree
+        round_counters = solution(counted_trees(read_round(start, step)))
+        if monophyletic_counters is None:
+            monophyletic_counters = round_counters
+        else:
+            monophyletic_counters = [count + round_count for count, round_count
+                                     in zip(monophyletic_counters,
+                                            round_counters)]
+        num_used += counted[0]
+        intervals = [wilson_interval(count, num_used)
+                     for count in monophyletic_counters]
+        if all(upper - lower < tolerance for lower, upper in intervals):
+            break
+    return(monophyletic_counters, num_used)
+
+
+def sample_chunks(treefile, num_trees, burnin, num_chunks, thin=1,
+                  position=0):
+    """Split trees after burnin into chunks of about the same number of
+    trees, given by indices of their first tree and of the tree after them.
+    Size of chunks is multiple of thin, so that every chunk starts with tree
+    that is used. Every chunk also gets position of its first tree in
+    sequence of trees, where the first tree of file is at given position."""
+    size = max(1, -(-(num_trees - burnin) // num_chunks))
+    size = -(-size // thin) * thin
+    return([(treefile, start, min(start + size, num_trees), thin,
+             position + (start - burnin) // thin)
+            for start in range(burnin, num_trees, size)])
+
+
+def tree_file_chunks(treefile, offsets, burnin, num_chunks, thin=1,
+                     position=0):
+    """Split trees after burnin into chunks as sample_chunks does, but given
+    by byte offsets of trees (see index_tree_file)."""
+    return([(treefile, offsets[start], offsets[end], thin, position)
+            for treefile, start, end, thin, position in sample_chunks(
+                treefile, len(offsets) - 1, burnin, num_chunks, thin,
+                position)])
+
+
+#tree samples held by worker process, see init_worker
+worker_samples = dict()
+
+
+def init_worker(samples):
+    """Keep cached tree samples (see cached_tree_sample) of tree files in
+    worker process, so that they are passed to every worker only once."""
+    worker_samples.update(samples)
+
+
+def evaluate_chunk(task):
+    """Evaluate trees from chunk of tree file in worker process.
+
+    Only counts of monophyletic trees or split table are returned, so that
+    trees are never sent between processes. Trees of tree files with sample
+    held by worker (see init_worker) are taken from this sample.
+
+    Parameters
+    ----------
+    task : tuple
+        path to tree file, start and end byte offsets of chunk (indices of
+        trees for tree files with sample held by worker), thinning,
+        position of chunk in sequence of trees, name of solution ("bitset",
+        "numpy", "ete2" or "table"), groups of translated species, whether
+        trees are rooted, size of memo and number of all trees and of
+        batches for BatchMeans (None if batch means are not computed)
+
+    Returns
+    -------
+    result : tuple or Counter
+        number of monophyletic trees for every group and BatchMeans (or
+        None), or split table
+    """
+    (treefile, start, end, thin, position, solution, species_groups, rooted,
+     memo_size, batches) = task
+    memo = TopologyMemo(memo_size)
+    batch_means = None
+    if batches is not None:
+        batch_means = BatchMeans(len(species_groups), batches[0], batches[1],
+                                 position)
+    if treefile in worker_samples:
+        sample = worker_samples[treefile]
+        if solution != "table":
+            return(cached_solution(sample, start, thin, species_groups,
+                                   rooted, solution, batch_means, end),
+                   batch_means)
+        (trees, weights) = cached_topologies(sample, start, thin, end)[:2]
+        return(split_table(trees, rooted, weights)[0])
+    else:
+        trees = read_tree_chunk(treefile, start, end, thin)
+        if solution == "ete2":
+            return(ete2solution(trees, species_groups, rooted, memo,
+                                batch_means=batch_means), batch_means)
+        trees = (memo.evaluate(tree, tree_clades) for tree in trees)
+    if solution == "table":
+        return(split_table(trees, rooted)[0])
+    if solution == "numpy":
+        return(numpy_solution(trees, species_groups, rooted,
+                              batch_means=batch_means), batch_means)
+    return(bitset_solution(trees, species_groups, rooted,
+                           batch_means=batch_means), batch_means)
+
+
+def parallel_solution(chunks, jobs, solution, species_groups, rooted,
+                      memo_size, batch_means=None, samples=None):
+    """Evaluate chunks of tree files in pool of worker processes and sum
+    their results (see evaluate_chunk). Chunks are tuples of path to tree
+    file, start and end byte offsets, thinning and position of chunk in
+    sequence of trees (see tree_file_chunks). Cached tree samples of some
+    tree files can be given as dictionary by path, chunks of these files
+    are then given by indices of trees (see sample_chunks). If batch_means
+    is given, batch means of all chunks are added to it.
+
+    Returns
+    -------
+    result : list of ints or Counter
+        number of monophyletic trees for every group or split table
+    """
+    batches = None
+    if batch_means is not None:
+        batches = (batch_means.num_trees, batch_means.num_batches)
+    tasks = [chunk + (solution, species_groups, rooted, memo_size, batches)
+             for chunk in chunks]
+    import multiprocessing
+    pool = multiprocessing.Pool(jobs, init_worker, (samples or dict(),))
+    try:
+        results = pool.map(evaluate_chunk, tasks, chunksize=1)
+    finally:
+        pool.terminate()
+    if solution == "table":
+        table = collections.Counter()
+        for result in results:
+            table.update(result)
+        return(table)
+    monophyletic_counters = [0] * len(species_groups)
+    for (result, chunk_batch_means) in results:
+        for num, count in enumerate(result):
+            monophyletic_counters[num] += count
+        if batch_means is not None:
+            batch_means.update(chunk_batch_means)
+    return(monophyletic_counters)
+
+
+class FollowedTreeFile(object):
+    """Tree file, which is still being written by running MCMC.
+
+    Only trees appended since the last reading are read, starting from
+    remembered byte offset. Incomplete last line is left for the next
+    reading. Until the Translate block and the first tree are written,
+    nothing is read. With thinning, only every thin-th tree from the
+    beginning of file is parsed, other trees are only counted.
+    """
+    def __init__(self, treefile, thin=1):
+        self.treefile = treefile
+        self.thin = thin
+        self.translated_taxa = None
+        self.offset = None
+        self.num_trees = 0
+        self.finished = False
+
+    def read_new_trees(self):
+        """Return list of trees appended since the last call."""
+        if self.finished:
+            return([])
+        if self.offset is None:
+            try:
+                (self.translated_taxa, offsets) = index_tree_file(
+                    self.treefile)
+            except ParsingError:
+                #file is not written far enough yet
+                return([])
+            self.offset = offsets[0]
+        trees = []
+        with open(self.treefile, "rb") as tree_file:
+            tree_file.seek(self.offset)
+            for line in tree_file:
+                if not line.endswith("\n"):
+                    break
+                self.offset += len(line)
+                line = line.strip("\n\t ;")
+                if line.lower() == "end":
+                    #end of tree block, MCMC finished
+                    self.finished = True
+                    break
+                if self.num_trees % self.thin == 0:
+                    trees.append(strip_tree(line))
+                self.num_trees += 1
+        return(trees)
+
+
+def follow_trees(input_files, groups, burnin, thin, rooted, interval,
+                 memo_size, log_prior_function=compute_log_prior):
+    """Follow tree files of running MCMC and periodically print posterior
+    and Bayes factor of every group of species.
+
+    Every tree is evaluated only once when it is appended to file. Result
+    of every tree is remembered as bitmask of groups for which it is
+    monophyletic, so that when fraction of trees ignored as burnin grows
+    with number of trees, trees falling into burnin are subtracted from
+    counts. Following stops when all files are finished or is interrupted.
+    """
+    followers = [FollowedTreeFile(input_file, thin)
+                 for input_file in input_files]
+    tree_results = [[] for follower in followers]
+    burned = [0] * len(followers)
+    monophyletic_counters = [0] * len(groups)
+    memo = TopologyMemo(memo_size)
+    masks = None
+    print("\t".join(["time", "group", "trees", "trees_after_burnin",
+                     "monophyletic", "posterior", "bayes_factor"]))
+    try:
+        while True:
+            for num, follower in enumerate(followers):
+                trees = follower.read_new_trees()
+                if follower.translated_taxa is None:
+                    continue
+                if masks is None:
+                    for name, species in groups:
+                        check_species_in_taxa(species,
+                                              follower.translated_taxa)
+                    translated_taxa = follower.translated_taxa
+                    masks = [species_mask(translate_species(translated_taxa,
+                                                            species))
+                             for name, species in groups]
+                    #prior that can't be computed is reported as "NA", as
+                    #in table of groups (see monophyly_results)
+                    log_priors = []
+                    for name, species in groups:
+                        try:
+                            log_priors.append(log_prior_function(
+                                len(translated_taxa), len(species), rooted))
+                        except ValueError:
+                            log_priors.append(None)
+                else:
+                    check_species_equivalency([translated_taxa,
+                                               follower.translated_taxa])
+                for tree in trees:
+                    clades = memo.evaluate(tree, tree_clades)
+                    tree_results[num].append(sum(
+                        1 << group for group, mask in enumerate(masks)
+                        if is_monophyletic(clades, mask, rooted)))
+                #new trees are counted, trees newly in burnin are subtracted
+                new_burned = burnin_trees(follower.num_trees, burnin,
+                                          thin) // thin
+                for result in tree_results[num][len(tree_results[num]) -
+                                                len(trees):]:
+                    for group in range(len(groups)):
+                        monophyletic_counters[group] += result >> group & 1
+                for result in tree_results[num][burned[num]:new_burned]:
+                    for group in range(len(groups)):
+                        monophyletic_counters[group] -= result >> group & 1
+                burned[num] = new_burned
+            num_read = sum(follower.num_trees for follower in followers)
+            num_total = (sum(len(results) for results in tree_results) -
+                         sum(burned))
+            now = time.strftime("%Y-%m-%d %H:%M:%S")
+            for (name, species), count, log_prior in zip(
+                    groups, monophyletic_counters,
+                    log_priors if masks else []):
+                posterior = count / num_total if num_total else 0
+                factor = ("NA" if log_prior is None else "{0:.4g}".format(
+                    bayes_factor(log_prior, posterior)))
+                print("\t".join([now, name, str(num_read), str(num_total),
+                                 str(count), "{0:.4g}".format(posterior),
+                                 factor]))
+            sys.stdout.flush()
+            if all(follower.finished for follower in followers):
+                break
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    return(monophyletic_counters)
+
+
+def format_count(count):
+    """Format number of trees, or their weight for weighted trees."""
+    if isinstance(count, float):
+        return("{0:.4g}".format(count))
+    return(str(count))
+
+
+def monophyly_analysis(input_files, groups, burnin=0.2, thin=1,
+                       rooted=False, engine="bitset", use_cache=True,
+                       memo=None, log_prior_function=compute_log_prior,
+                       keep_indicators=False):
+    """Test monophyly of groups of species in posterior tree samples and
+    return results instead of printing them.
+
+    This is what BayesMonophyly does with input files in single process
+    and it is also used from other Python programs, which can test many
+    samples or groups without starting new interpreter for each of them.
+    Errors are raised as exceptions (ParsingError, RuntimeError or
+    ValueError) and nothing is printed.
+
+    Parameters
+    ----------
+    input_files : list of strings
+        paths to posterior tree samples with the same taxa, either all
+        weighted or all unweighted (see are_weighted_tree_files)
+    groups : list of tuples
+        name of group and list of its species, see parse_groups_file
+    burnin : int or float
+        trees ignored at the beginning of every file, fraction of trees if
+        smaller than one, otherwise number of trees (see burnin_trees)
+    thin : int
+        only every thin-th tree after burnin is used
+    rooted : bool
+        whether trees are rooted
+    engine : string
+        "bitset", "numpy" or "ete2"
+    use_cache : bool
+        whether cache of parsed files is used and created (not with ete2)
+    memo : TopologyMemo, optional
+        memo of repeated trees, which keeps statistics of reused results,
+        new one if not given
+    log_prior_function : function
+        computes logarithm of prior, see get_log_prior_function
+    keep_indicators : bool
+        whether monophyly of every tree is kept in results (only with
+        "numpy" engine, see numpy_solution)
+
+    Returns
+    -------
+    results : list of MonophylyResult
+        result for every group, with number of trees read
+    """
+    for name, species in groups:
+        check_species_group(species)
+    if keep_indicators and engine != "numpy":
+        raise ValueError("Monophyly of every tree is kept only by numpy"
+                         " engine.")
+    text_trees = engine == "ete2"
+    if memo is None:
+        memo = TopologyMemo()
+    all_translated_taxa = []
+    batch_means = None
+    if are_weighted_tree_files(input_files):
+        weighted_trees = []
+        for input_file in input_files:
+            (translated_taxa, trees) = parse_weighted_tree_file(input_file)
+            weighted_trees.extend(trees)
+            all_translated_taxa.append(translated_taxa)
+        trees = (tree for tree, weight in weighted_trees)
+        if not text_trees:
+            trees = (memo.evaluate(tree, tree_clades) for tree in trees)
+        weights = [weight for tree, weight in weighted_trees]
+        num_total = sum(weights)
+        num_read = len(weighted_trees)
+    else:
+        all_samples = []
+        all_trees_nums = []
+        for input_file in input_files:
+            sample = None
+            if use_cache and not text_trees:
+                sample = cached_tree_sample(input_file,
+                                            memo_size=memo.maxsize)
+            if sample is not None:
+                translated_taxa = sample[0]
+                all_trees_nums.append(len(sample[2]))
+            else:
+                (translated_taxa, tree_lines) = read_tree_lines(input_file)
+                all_trees_nums.append(sum(1 for line in tree_lines))
+            all_translated_taxa.append(translated_taxa)
+            all_samples.append(sample)
+        all_burnins = [burnin_trees(trees_num, burnin, thin)
+                       for trees_num in all_trees_nums]
+        num_total = sum(len(xrange(file_burnin, trees_num, thin))
+                        for file_burnin, trees_num in zip(all_burnins,
+                                                          all_trees_nums))
+        batch_means = BatchMeans(len(groups), num_total)
+        weights = None
+        num_read = sum(all_trees_nums)
+    for translated_taxa in all_translated_taxa:
+        for name, species in groups:
+            check_species_in_taxa(species, translated_taxa)
+    check_species_equivalency(all_translated_taxa)
+    if not num_total:
+        raise ValueError("No trees left after burnin.")
+    species_groups = [translate_species(all_translated_taxa[0], species)
+                      for name, species in groups]
+    def solution(trees):
+        if engine == "ete2":
+            return(ete2solution(trees, species_groups, rooted, memo,
+                                weights, batch_means))
+        elif engine == "numpy":
+            return(numpy_solution(trees, species_groups, rooted, weights,
+                                  batch_means,
+                                  keep_indicators=keep_indicators))
+        return(bitset_solution(trees, species_groups, rooted, weights,
+                               batch_means))
+    profiler.switch("monophyly")
+    if weights is not None:
+        file_results = [solution(trees)]
+    else:
+        #files are evaluated in order, so that batch means get trees in
+        #order, cached samples test every distinct topology only once
+        file_results = [
+            cached_solution(sample, file_burnin, thin, species_groups,
+                            rooted, engine, batch_means,
+                            keep_indicators=keep_indicators)
+            if sample is not None else
+            solution(burned_trees(input_file, sample, file_burnin, thin,
+                                  memo, text_trees))
+            for input_file, sample, file_burnin in zip(
+                input_files, all_samples, all_burnins)]
+    profiler.switch("other", memory=True)
+    profiler.add_trees("monophyly", num_total if weights is None
+                       else num_read)
+    indicators = None
+    if keep_indicators:
+        import numpy
+        indicators = numpy.hstack([file_indicators for file_counters,
+                                   file_indicators in file_results])
+        file_results = [file_counters for file_counters, file_indicators
+                        in file_results]
+    monophyletic_counters = [sum(counts) for counts in zip(*file_results)]
+    results = monophyly_results(groups, monophyletic_counters, num_total,
+                                len(all_translated_taxa[0]), rooted,
+                                log_prior_function, batch_means, indicators)
+    for result in results:
+        result.num_read = num_read
+    return(results)
+
+
+def print_groups_table(results):
+    """Print tab-separated table with prior, posterior and Bayes factor
+    for every group of species (see monophyly_results).
+
+    Special cases that would raise error for single group (prior or posterior
+    equal to one) are reported as "NA" or "inf" so that other groups are
+    not lost. Monte Carlo standard error of posterior, effective sample size
+    and confidence interval of Bayes factor are "NA" if they are not known.
+    Prior and Bayes factor that are too small or too large for float are
+    printed as zero or "inf", but logarithm of Bayes factor is always exact.
+    """
+    format_value = lambda value: ("NA" if value is None
+                                  else "{0:.4g}".format(value))
+    print("\t".join(["group", "species", "monophyletic", "expected", "prior",
+                     "posterior", "bayes_factor", "posterior_mcse", "ess",
+                     "bayes_factor_lower", "bayes_factor_upper",
+                     "log_bayes_factor"]))
+    for result in results:
+        interval = result.bayes_factor_interval or (None, None)
+        print("\t".join([result.name, ",".join(result.species),
+                         format_count(result.num_monophyletic),
+                         "NA" if result.expected is None
+                         else format_count(result.expected),
+                         format_value(result.prior),
+                         "{0:.4g}".format(result.posterior),
+                         format_value(result.bayes_factor),
+                         format_value(result.standard_error),
+                         format_value(result.effective_sample_size),
+                         format_value(interval[0]),
+                         format_value(interval[1]),
+                         format_value(result.log_bayes_factor)]))
+
+
+def format_log_values(log_prior, posterior):
+    """Return lines with logarithm of prior and of Bayes factor, if they are
+    too small or too large to be printed as floats, otherwise nothing."""
+    lines = ""
+    if math.exp(log_prior) == 0:
+        lines += "Log prior: {0:.4f}\n".format(log_prior)
+    log_factor = log_bayes_factor(log_prior, posterior)
+    if 0 < posterior < 1 and (log_factor > math.log(sys.float_info.max) or
+                              math.exp(log_factor) == 0):
+        lines += "Log Bayes factor: {0:.4f}\n".format(log_factor)
+    return(lines)
+
+
+if __name__ == "__main__":
+    args=parse_args()
+    if args.profile or args.profile_json:
+        profiler.enable()
+        atexit.register(lambda: sys.stderr.write(
+            profiler.report(args.profile_json)))
+    if args.groups:
+        groups = parse_groups_file(args.groups)
+    else:
+        groups = [("species", args.species)]
+    for name, species in groups:
+        try:
+            check_species_group(species)
+        except ValueError as error:
+            if args.groups:
+                print "ERROR: {0} (group {1})".format(error, name)
+            else:
+                print "ERROR: {0}".format(error)
+            sys.exit()
+    if args.burnin < 0 or args.thin < 1:
+        print "ERROR: Burnin can't be negative and thinning must be positive."
+        sys.exit()
+    #memo size is given in MB
+    memo_size = int(args.memo_size * 1024**2)
+    if args.tolerance is not None:
+        if not 0 < args.tolerance <= 1:
+            print "ERROR: Tolerance must be in (0, 1]."
+            sys.exit()
+        if args.table or args.save_table or args.consensus or args.follow:
+            print "ERROR: Sequential reading works only with input files."
+            sys.exit()
+    if args.engine == "numpy":
+        try:
+            import numpy
+        except ImportError:
+            sys.stderr.write("NumPy is not installed, bitset engine is used"
+                             " instead.\n")
+            args.engine = "bitset"
+    if args.prior_model is not None:
+        if args.prior_samples < 1:
+            print "ERROR: Number of simulated topologies must be positive."
+            sys.exit()
+        if args.seed is None:
+            args.seed = random.SystemRandom().randint(0, 2**31 - 1)
+            sys.stderr.write("Seed of prior simulation: {0}\n".format(
+                args.seed))
+    log_prior_function = profiler.timed_function(get_log_prior_function(
+        args.prior_model, args.exact_prior, args.prior_samples, args.seed,
+        args.jobs), "prior")
+
+    if args.follow:
+        if not args.input:
+            print "ERROR: Only input files can be followed."
+            sys.exit()
+        if any(os.path.exists(input_file) and
+               compression_format(input_file) is not None
+               for input_file in args.input):
+            print "ERROR: Compressed files can't be followed."
+            sys.exit()
+        follow_trees(args.input, groups, args.burnin, args.thin, args.rooted,
+                     args.interval, memo_size, log_prior_function)
+        sys.exit()
+
+    use_table = args.table or args.save_table or args.consensus
+    try:
+        weighted = bool(args.input) and are_weighted_tree_files(args.input)
+    except ValueError as error:
+        print "ERROR: {0}".format(error)
+        sys.exit()
+    #evaluation in single process is done in the same way as from Python,
+    #split table, sequential reading and worker processes are used only here
+    serial = not use_table and (weighted or (args.jobs == 1 and
+                                             args.tolerance is None))
+    memo = TopologyMemo(memo_size)
+    batch_means = None
+    if serial:
+        results = monophyly_analysis(
+            args.input, groups, args.burnin, args.thin, args.rooted,
+            args.engine, not args.no_cache, memo, log_prior_function)
+        all_trees_num = results[0].num_read
+        #order of weighted trees is not known
+        with_error = not weighted
+    elif args.table:
+        weights = None
+        (table, translated_taxa, num_total, all_trees_num,
+         rooted) = load_split_table(args.table)
+        if rooted != args.rooted:
+            print "ERROR: Table was computed for {0} trees.".format(
+                "rooted" if rooted else "unrooted")
+            sys.exit()
+        for name, species in groups:
+            check_species_in_taxa(species,translated_taxa)
+        all_translated_taxa = [translated_taxa]
+    elif weighted:
+        #every distinct tree is listed only once with its weight, so there
+        #are only few trees and they are not cached nor split into chunks
+        all_translated_taxa = []
+        weighted_trees = []
+        for input_file in args.input:
+            (translated_taxa, trees) = parse_weighted_tree_file(input_file)
+            weighted_trees.extend(trees)
+            for name, species in groups:
+                check_species_in_taxa(species,translated_taxa)
+            all_translated_taxa.append(translated_taxa)
+        check_species_equivalency(all_translated_taxa)
+        all_trees_burned = (memo.evaluate(tree, tree_clades)
+                            for tree, weight in weighted_trees)
+        weights = [weight for tree, weight in weighted_trees]
+        num_total = sum(weights)
+        all_trees_num = len(weighted_trees)
+        chunks = []
+    else:
+        #ete2 needs trees in text form, other solutions use clades
+        text_trees = args.engine == "ete2" and not (args.save_table or
+                                                    args.consensus)
+        use_cache = not (text_trees or args.no_cache)
+        #sequential reading is done in this process
+        parallel = args.jobs > 1 and args.tolerance is None
+        #read translate blocks and count trees in all input files
+        all_translated_taxa = []
+        all_trees_nums = []
+        all_samples = []
+        all_offsets = []
+        for input_file in args.input:
+            (sample, offsets) = (None, None)
+            if use_cache:
+                #in parallel, files without valid cache are parsed by
+                #workers, in sequential reading only trees that are used
+                #are parsed
+                sample = cached_tree_sample(
+                    input_file, build=not (parallel or
+                                           args.tolerance is not None),
+                    memo_size=memo_size)
+            if sample is not None:
+                translated_taxa = sample[0]
+                all_trees_nums.append(len(sample[2]))
+            elif ((parallel or args.tolerance is not None) and
+                  compression_format(input_file) is None):
+                #compressed files can't be split and are read as a whole,
+                #in sequential reading, every round reads only its trees
+                (translated_taxa, offsets) = index_tree_file(input_file)
+                all_trees_nums.append(len(offsets) - 1)
+            else:
+                #trees are only counted, so that burnin is known before
+                #reading them
+                (translated_taxa, tree_lines) = read_tree_lines(input_file)
+                all_trees_nums.append(sum(1 for line in tree_lines))
+            for name, species in groups:
+                check_species_in_taxa(species,translated_taxa)
+            all_translated_taxa.append(translated_taxa)
+            all_samples.append(sample)
+            all_offsets.append(offsets)
+        
+        check_species_equivalency(all_translated_taxa)
+        #if equivalent, every file has same species, can use the first one
+        #apply burnin, trees are read one by one and burnin is skipped
+        all_burnins = [burnin_trees(trees_num, args.burnin, args.thin)
+                       for trees_num in all_trees_nums]
+        all_kept_nums = [len(xrange(burnin, trees_num, args.thin))
+                         for burnin, trees_num in zip(all_burnins,
+                                                      all_trees_nums)]
+        num_total = sum(all_kept_nums)
+        #in parallel, trees of files with cache or offsets are evaluated by
+        #workers, other (compressed) files are read in this process
+        in_parallel = [parallel and (sample is not None or
+                                     offsets is not None)
+                       for sample, offsets in zip(all_samples, all_offsets)]
+        #for batch means, trees evaluated in this process come first and
+        #trees from chunks evaluated in parallel follow
+        batch_means = BatchMeans(len(groups), num_total)
+        position = sum(kept_num for kept_num, evaluated_in_parallel in zip(
+            all_kept_nums, in_parallel) if not evaluated_in_parallel)
+        all_trees_burned = []
+        chunks = []
+        parallel_samples = dict()
+        for input_file, burnin, kept_num, sample, offsets in zip(
+                args.input, all_burnins, all_kept_nums, all_samples,
+                all_offsets):
+            if args.tolerance is not None:
+                #trees are read later in rounds
+                continue
+            if offsets is not None:
+                chunks.extend(tree_file_chunks(input_file, offsets, burnin,
+                                               args.jobs * 4, args.thin,
+                                               position))
+                position += kept_num
+            elif parallel and sample is not None:
+                chunks.extend(sample_chunks(input_file, len(sample[2]),
+                                            burnin, args.jobs * 4, args.thin,
+                                            position))
+                parallel_samples[input_file] = sample
+                position += kept_num
+            else:
+                all_trees_burned.append(burned_trees(
+                    input_file, sample, burnin, args.thin, memo, text_trees))
+        all_trees_burned = itertools.chain.from_iterable(all_trees_burned)
+        weights = None
+        all_trees_num = sum(all_trees_nums)
+    if not serial:
+        species_groups = [translate_species(all_translated_taxa[0], species)
+                          for name, species in groups]
+        profiler.switch("monophyly")
+        if args.tolerance is not None and not use_table:
+            def read_round(start, step):
+                #every file is read with the same stride, files with offsets
+                #of trees are not scanned again from the beginning in every
+                #round, only compressed files are
+                return(itertools.chain.from_iterable(
+                    burned_trees(input_file, sample,
+                                 burnin + start * args.thin, step * args.thin,
+                                 memo, text_trees, offsets)
+                    for input_file, burnin, sample, offsets in zip(
+                        args.input, all_burnins, all_samples, all_offsets)))
+            if args.engine == "ete2":
+                solution = lambda trees: ete2solution(
+                    trees, species_groups, args.rooted, memo)
+            elif args.engine == "numpy":
+                solution = lambda trees: numpy_solution(
+                    trees, species_groups, args.rooted)
+            else:
+                solution = lambda trees: bitset_solution(
+                    trees, species_groups, args.rooted)
+            (monophyletic_counters, num_used) = sequential_solution(
+                read_round, max(all_kept_nums), solution, args.tolerance)
+            sys.stderr.write(
+                "Sequential reading used {0} of {1} trees.\n".format(
+                    num_used, num_total))
+            num_burned = num_total
+            num_total = num_used
+            #trees are not read in order of chain
+            batch_means = None
+        elif use_table:
+            if not args.table:
+                table = split_table(all_trees_burned, args.rooted, weights)[0]
+                if chunks:
+                    table.update(parallel_solution(
+                        chunks, args.jobs, "table", species_groups,
+                        args.rooted, memo_size,
+                        samples=parallel_samples))
+            if args.save_table:
+                save_split_table(args.save_table, table,
+                                 all_translated_taxa[0], num_total,
+                                 all_trees_num, args.rooted)
+            if args.consensus:
+                save_consensus(args.consensus, table, num_total,
+                               all_translated_taxa[0])
+            #order of trees is lost in table
+            batch_means = None
+            monophyletic_counters = table_solution(
+                table, num_total, species_groups, all_translated_taxa[0],
+                args.rooted)
+        else:
+            if args.engine == "ete2":
+                monophyletic_counters = ete2solution(
+                    all_trees_burned, species_groups, args.rooted, memo,
+                    weights, batch_means)
+            elif args.engine == "numpy":
+                monophyletic_counters = numpy_solution(
+                    all_trees_burned, species_groups, args.rooted, weights,
+                    batch_means)
+            else:
+                monophyletic_counters = bitset_solution(
+                    all_trees_burned, species_groups, args.rooted, weights,
+                    batch_means)
+            if chunks:
+                monophyletic_counters = [count + parallel_count for
+                                         count, parallel_count in zip(
+                    monophyletic_counters, parallel_solution(
+                        chunks, args.jobs, args.engine, species_groups,
+                        args.rooted, memo_size, batch_means,
+                        parallel_samples))]
+        profiler.switch("other", memory=True)
+        if not args.table:
+            profiler.add_trees("monophyly", num_total if weights is None
+                               else all_trees_num)
+        results = monophyly_results(groups, monophyletic_counters, num_total,
+                                    len(all_translated_taxa[0]), args.rooted,
+                                    log_prior_function, batch_means)
+        with_error = batch_means is not None
+    if memo.hits + memo.misses:
+        sys.stderr.write(memo.report())
+
+    if args.groups:
+        print_groups_table(results)
+        sys.exit()
+
+    result = results[0]
+    if result.log_prior is None:
+        print ("ERROR: Prior can't be computed, species are monophyletic in"
+               " every tree or their prior is too small to be simulated.")
+        sys.exit()
+    num_monophyletic = result.num_monophyletic
+    num_total = result.num_total
+    log_prior = result.log_prior
+    prior = result.prior
+    #posterior one gives infinite Bayes factor, as in table of groups
+    posterior = result.posterior
+    if with_error:
+        error = format_error(posterior, result.standard_error, log_prior)
+    log_values = format_log_values(log_prior, posterior)
+    factor = result.bayes_factor
+    #output:
+    if isinstance(num_total, float):
+        #weighted trees, counts are sums of weights
+        output=("Weighted trees read: {0}\n"
+                "Total weight of trees: {1:.4g}\n"
+                "Weight of monophyletic trees: {2:.4g}\n\n"
+                "Prior: {3:.4g}\n"
+                "Posterior: {4:.4g}\n"
+                "Bayes factor: {5:.4g}\n"
+                ).format(all_trees_num, num_total, num_monophyletic,
+                         float(prior), float(posterior), factor)
+        print output + log_values
+        sys.exit()
+    all_trees_burned_num = num_total
+    if args.tolerance is not None:
+        #only num_total trees after burnin were used by sequential reading
+        all_trees_burned_num = num_burned
+    expected_monophyletic = int(round(prior*num_total))
+    if(prior > 0.0001 and posterior > 0.0001 and factor > 0.0001):
         number_format = "f"
     else:
         number_format = "e"
 
     output=("Total trees read: {0}\n"
             "Trees after burnin: {1}\n"
+            + ("Trees used: {8}\n" if args.tolerance is not None else "") +
             "Monophyletic trees found: {5}\n"
             "Monophyletic trees expected: {3}\n"
             "(in the case of noninformative data)\n\n"
@@ -368,13 +3287,20 @@ if __name__ == "__main__":
                     expected_monophyletic,
                     float(posterior),
                     num_monophyletic,
-                    bayes_factor,
-                    number_format
+                    factor,
+                    number_format,
+                    num_total
                     )
+    output += log_values
+    if with_error:
+        output += ("Monte Carlo standard error of posterior: {0}"
+                   " (effective sample size: {1})\n"
+                   "Bayes factor 95% confidence interval: {2} - {3}\n"
+                   ).format(*error)
     print output
-    if bayes_factor==0:
+    if factor==0:
         print("Probability of this by chance alone given prior: {0:.4{1}}"
-              .format((1-prior)**all_trees_burned_num, number_format))
+              .format((1-prior)**num_total, number_format))
 
     if expected_monophyletic == 0:
         print("Tree sample is too small for specified monophyly to occur at random!")
@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+from __future__ import division
+import sys
+import os
+import time
+import json
+import random
+import shutil
+import resource
+import tempfile
+import itertools
+import multiprocessing
+import argparse as arg
+import BayesMonophyly as bm
+import PosteriorTopology as pt
+
+def parse_args():
+    parser = arg.ArgumentParser(
+        prog="Benchmark",
+        description=(
+            "Generate synthetic posterior tree samples in style of MrBayes or"
+            " BEAST and measure time and peak memory of every stage of"
+            " BayesMonophyly and PosteriorTopology on them. Results of all"
+            " engines are compared, so that both speed and correctness of"
+            " changes can be checked."
+            )
+        )
+    parser.add_argument(
+        "-n", "--taxa", required=False, default=[20, 100], nargs="+",
+        type=int,
+        help="Numbers of taxa of generated samples, one sample for each."
+        )
+    parser.add_argument(
+        "-m", "--trees", required=False, default=10000, type=int,
+        help="Number of trees in every generated sample."
+        )
+    parser.add_argument(
+        "--style", required=False, default="mrbayes",
+        choices=["mrbayes", "beast"],
+        help=(
+            "Style of generated files. MrBayes trees are unrooted with"
+            " branch lengths, BEAST trees are rooted and every node can"
+            " have comment with annotations."
+            )
+        )
+    parser.add_argument(
+        "--annotations", required=False, default=0.5, type=float,
+        help=(
+            "Fraction of nodes with annotation comment in BEAST style"
+            " (0 to 1)."
+            )
+        )
+    parser.add_argument(
+        "--topologies", required=False, default=100, type=int,
+        help=(
+            "Number of distinct topologies in sample, trees are drawn from"
+            " them at random. Branch lengths of every tree are different."
+            )
+        )
+    parser.add_argument(
+        "--groups", required=False, default=10, type=int,
+        help=(
+            "Number of tested groups of species. Half of them are clades of"
+            " one of topologies, so that they are often monophyletic."
+            )
+        )
+    parser.add_argument(
+        "--seed", required=False, default=1, type=int,
+        help="Seed of random number generator of generated samples."
+        )
+    parser.add_argument(
+        "--stages", required=False, nargs="+", default=STAGES,
+        choices=STAGES,
+        help="Stages to run, all by default."
+        )
+    parser.add_argument(
+        "--max-memory", required=False, type=float,
+        help=(
+            "Peak memory in MB, which no stage may exceed. Stages above it"
+            " are reported as OVER_MEMORY and script ends with error, so"
+            " that memory of large samples can be checked, e.g. with"
+            " \"-n 500 -m 12000 --topologies 11000 --stages cache cached"
+            " --max-memory 100\"."
+            )
+        )
+    parser.add_argument(
+        "-o", "--output", required=False,
+        help="Save results as JSON into file."
+        )
+    parser.add_argument(
+        "--keep", required=False,
+        help=(
+            "Directory, in which generated samples are kept. By default,"
+            " they are written into temporary directory and removed."
+            )
+        )
+    args = parser.parse_args()
+    return(args)
+
+
+def random_topology(num_taxa, rng, rooted):
+    """Return random topology as nested lists of numbers of taxa, made by
+    joining random pairs of lineages. Unrooted topology has three lineages
+    at its root."""
+    nodes = range(1, num_taxa + 1)
+    while len(nodes) > (2 if rooted else 3):
+        first = nodes.pop(rng.randrange(len(nodes)))
+        second = nodes.pop(rng.randrange(len(nodes)))
+        nodes.append([first, second])
+    return(nodes)
+
+
+ANNOTATION = "[&rate={0:.4g},height_95%_HPD={{{1:.4g},{2:.4g}}}]"
+
+
+def format_tree(topology, rng, annotations=0):
+    """Write topology in Newick format with random branch lengths. Fraction
+    annotations of nodes have comment with random annotations."""
+    def node_text(node):
+        if isinstance(node, list):
+            text = "(" + ",".join(node_text(child) for child in node) + ")"
+        else:
+            text = str(node)
+        if annotations and rng.random() < annotations:
+            height = rng.random()
+            text += ANNOTATION.format(rng.random(), height, 2*height)
+        return(text + ":{0:.6g}".format(rng.expovariate(10)))
+    return("(" + ",".join(node_text(node) for node in topology) + ")")
+
+
+def write_tree_file(treefile, num_taxa, num_trees, style="mrbayes",
+                    annotations=0, num_topologies=100, seed=1):
+    """Write synthetic posterior tree sample.
+
+    Trees are drawn at random from num_topologies random topologies and
+    written one by one, so that file of any size can be written. Files in
+    MrBayes style have unrooted trees with branch lengths, files in BEAST
+    style have Taxa block and rooted trees with posterior and annotations
+    of fraction annotations of nodes.
+
+    Returns
+    -------
+    topologies : list of nested lists
+        distinct topologies, see random_topology
+    """
+    rng = random.Random(seed)
+    rooted = style == "beast"
+    topologies = [random_topology(num_taxa, rng, rooted)
+                  for num in range(num_topologies)]
+    with open(treefile, "w") as tree_file:
+        tree_file.write("#NEXUS\n")
+        if rooted:
+            tree_file.write("\nBegin taxa;\n\tDimensions ntax={0};\n"
+                            "\tTaxlabels\n".format(num_taxa))
+            for taxon in range(1, num_taxa + 1):
+                tree_file.write("\t\tSp_{0}\n".format(taxon))
+            tree_file.write("\t\t;\nEnd;\n\nBegin trees;\n\tTranslate\n")
+        else:
+            tree_file.write("[ID: {0}]\n[Param: tree]\nbegin trees;\n"
+                            "   translate\n".format(seed))
+        for taxon in range(1, num_taxa + 1):
+            tree_file.write("\t\t{0} Sp_{0}{1}\n".format(
+                taxon, "," if taxon < num_taxa or rooted else ";"))
+        if rooted:
+            tree_file.write("\t\t;\n")
+        for num in range(num_trees):
+            topology = rng.choice(topologies)
+            if rooted:
+                tree_file.write("tree STATE_{0} = [&lnP={1:.2f},posterior="
+                                "{1:.2f}] {2};\n".format(
+                                    num * 1000, -1000 - 10*rng.random(),
+                                    format_tree(topology, rng, annotations)))
+            else:
+                tree_file.write("   tree gen.{0} = [&U] {1};\n".format(
+                    num * 100, format_tree(topology, rng)))
+        tree_file.write("end;\n")
+    return(topologies)
+
+
+def generate_sample(treefile, num_taxa, num_trees, style, annotations,
+                    num_topologies, num_groups, seed):
+    """Write synthetic posterior tree sample (see write_tree_file) and
+    return groups of species for benchmark and topology of the first
+    tree."""
+    topologies = write_tree_file(treefile, num_taxa, num_trees, style,
+                                 annotations, num_topologies, seed)
+    return(benchmark_groups(topologies, num_taxa, num_groups, seed),
+           topologies[0])
+
+
+def topology_clades(topology):
+    """Return all clades of topology as lists of numbers of taxa."""
+    clades = []
+    def taxa(node):
+        if not isinstance(node, list):
+            return([node])
+        node_taxa = list(itertools.chain.from_iterable(
+            taxa(child) for child in node))
+        clades.append(node_taxa)
+        return(node_taxa)
+    for node in topology:
+        taxa(node)
+    return(clades)
+
+
+def benchmark_groups(topologies, num_taxa, num_groups, seed=1):
+    """Return groups of species for benchmark, as lists of numbers of taxa
+    translated into strings. Half of groups are clades of the first
+    topology, other are random."""
+    rng = random.Random(seed)
+    clades = topology_clades(topologies[0])
+    groups = rng.sample(clades, min(len(clades), num_groups // 2))
+    while len(groups) < num_groups:
+        groups.append(rng.sample(range(1, num_taxa + 1),
+                                 rng.randint(2, num_taxa - 1)))
+    return([[str(taxon) for taxon in group] for group in groups])
+
+
+def read_trees(treefile):
+    (translated_taxa, trees) = bm.parse_tree_file(treefile)
+    return(sum(1 for tree in trees))
+
+
+def parse_clades(treefile):
+    (translated_taxa, trees) = bm.parse_tree_file(treefile)
+    return(sum(1 for tree in trees if bm.tree_clades(tree)))
+
+
+def build_cache(treefile):
+    cachefile = treefile + bm.CACHE_SUFFIX
+    if os.path.exists(cachefile):
+        os.remove(cachefile)
+    (translated_taxa, topologies,
+     tree_topologies) = bm.cached_tree_sample(treefile)
+    return(len(topologies))
+
+
+def monophyly(treefile, species_groups, rooted, engine):
+    """Count monophyletic trees of every group with engine, in the same way
+    as BayesMonophyly without cache."""
+    memo = bm.TopologyMemo()
+    (translated_taxa, trees) = bm.parse_tree_file(treefile)
+    if engine == "ete2":
+        return(bm.ete2solution(trees, species_groups, rooted, memo))
+    trees = (memo.evaluate(tree, bm.tree_clades) for tree in trees)
+    if engine == "numpy":
+        return(bm.numpy_solution(trees, species_groups, rooted))
+    if engine == "table":
+        (table, num_total) = bm.split_table(trees, rooted)
+        return(bm.table_solution(table, num_total, species_groups,
+                                 translated_taxa, rooted))
+    return(bm.bitset_solution(trees, species_groups, rooted))
+
+
+def cached_monophyly(treefile, species_groups, rooted):
+    """Count monophyletic trees of every group from existing cache, in the
+    same way as BayesMonophyly with cache."""
+    sample = bm.cached_tree_sample(treefile)
+    batch_means = bm.BatchMeans(len(species_groups), len(sample[2]))
+    return(bm.cached_solution(sample, 0, 1, species_groups, rooted,
+                              batch_means=batch_means))
+
+
+def topology_frequency(treefile, query_topology, rooted, engine):
+    """Count trees with query topology, in the same way as PosteriorTopology
+    without cache."""
+    memo = bm.TopologyMemo()
+    (translated_taxa, trees) = bm.parse_tree_file(treefile)
+    query_tree = bm.strip_newick(format_tree(query_topology,
+                                             random.Random(0)))
+    if engine == "ete2":
+        return(pt.count_trees([query_tree], trees, memo, rooted)[0])
+    query_keys = [bm.topology_key(bm.tree_clades(query_tree), rooted)]
+    return(pt.count_topologies(query_keys, trees, memo, rooted)[0])
+
+
+def priors(num_taxa, rooted, exact):
+    return([bm.compute_prior(num_taxa, num_species, rooted, exact)
+            for num_species in range(2, num_taxa - 1)])
+
+
+def simulated_sizes(num_taxa):
+    """Sizes of groups, for which prior is simulated. Prior of larger
+    groups is often too small to be estimated."""
+    return(sorted(set([2, 3, num_taxa - 2])))
+
+
+def simulated_priors(num_taxa, rooted, num_samples=100000):
+    return([bm.simulate_monophyly((num_taxa, num_species, rooted, "uniform",
+                                   num_samples, 1)) / num_samples
+            for num_species in simulated_sizes(num_taxa)])
+
+
+STAGES = ["read", "clades", "cache", "bitset", "numpy", "ete2", "table",
+          "cached", "topology", "topology_ete2", "prior", "exact_prior",
+          "simulated_prior"]
+
+
+def run_stage(function, *args):
+    """Run function in new process and return its result, wall time and
+    peak resident memory of the process in MB."""
+    (receiver, sender) = multiprocessing.Pipe(False)
+    def stage():
+        start = time.time()
+        try:
+            result = function(*args)
+        except Exception as error:
+            result = error
+        sender.send((result, time.time() - start,
+                     resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024))
+    process = multiprocessing.Process(target=stage)
+    process.start()
+    (result, seconds, peak_memory) = receiver.recv()
+    process.join()
+    if isinstance(result, Exception):
+        raise result
+    return(result, seconds, peak_memory)
+
+
+def check_result(stage, result, results, num_taxa, rooted):
+    """Compare result of stage with result of stage, which computes the same
+    by other means. Returns "ok", "MISMATCH" or "" if there is nothing to
+    compare with."""
+    reference = {"clades": "read", "numpy": "bitset", "ete2": "bitset",
+                 "table": "bitset", "cached": "bitset",
+                 "topology_ete2": "topology", "exact_prior": "prior",
+                 "simulated_prior": "prior"}.get(stage)
+    if reference not in results:
+        return("")
+    expected = results[reference]
+    if stage == "exact_prior":
+        same = all(abs(value - other) <= 1e-9 * other
+                   for value, other in zip(result, expected))
+    elif stage == "simulated_prior":
+        #estimate should be within four standard errors
+        same = True
+        for value, num_species in zip(result, simulated_sizes(num_taxa)):
+            prior = bm.compute_prior(num_taxa, num_species, rooted)
+            error = (prior * (1 - prior) / 100000) ** 0.5
+            same &= abs(value - prior) <= 4 * error + 1e-12
+    else:
+        same = result == expected
+    return("ok" if same else "MISMATCH")
+
+
+def available_stages(stages):
+    """Remove stages of engines, which are not installed."""
+    for module, module_stages in [("numpy", ["numpy"]),
+                                  ("ete2", ["ete2", "topology_ete2"])]:
+        try:
+            __import__(module)
+        except ImportError:
+            stages = [stage for stage in stages
+                      if stage not in module_stages]
+    return(stages)
+
+
+def benchmark(treefile, num_taxa, num_trees, rooted, groups, query_topology,
+              stages, max_memory=None):
+    """Run every stage on tree file and return list of records with results
+    and their times and memory. Stages with peak memory above max_memory
+    (in MB) are checked as OVER_MEMORY."""
+    stage_calls = {
+        "read": (read_trees, treefile),
+        "clades": (parse_clades, treefile),
+        "cache": (build_cache, treefile),
+        "cached": (cached_monophyly, treefile, groups, rooted),
+        "topology": (topology_frequency, treefile, query_topology, rooted,
+                     "hash"),
+        "topology_ete2": (topology_frequency, treefile, query_topology,
+                          rooted, "ete2"),
+        "prior": (priors, num_taxa, rooted, False),
+        "exact_prior": (priors, num_taxa, rooted, True),
+        "simulated_prior": (simulated_priors, num_taxa, rooted),
+        }
+    for engine in ["bitset", "numpy", "ete2", "table"]:
+        stage_calls[engine] = (monophyly, treefile, groups, rooted, engine)
+    if "cached" in stages and "cache" not in stages:
+        bm.cached_tree_sample(treefile)
+    records = []
+    results = {}
+    for stage in STAGES:
+        if stage not in stages:
+            continue
+        (result, seconds, peak_memory) = run_stage(*stage_calls[stage])
+        check = check_result(stage, result, results, num_taxa, rooted)
+        if (max_memory is not None and peak_memory > max_memory and
+                check != "MISMATCH"):
+            check = "OVER_MEMORY"
+        results.setdefault(stage, result)
+        record = {"taxa": num_taxa, "trees": num_trees, "stage": stage,
+                  "seconds": seconds, "peak_memory_mb": peak_memory,
+                  "check": check}
+        if stage not in ["prior", "exact_prior", "simulated_prior"]:
+            record["trees_per_second"] = num_trees / seconds
+        records.append(record)
+        print("\t".join([str(num_taxa), str(num_trees), stage,
+                         "{0:.3f}".format(seconds),
+                         "{0:.0f}".format(record["trees_per_second"])
+                         if "trees_per_second" in record else "NA",
+                         "{0:.1f}".format(peak_memory), check]))
+        sys.stdout.flush()
+    return(records)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if not 0 <= args.annotations <= 1:
+        print "ERROR: Fraction of annotated nodes must be in [0, 1]."
+        sys.exit()
+    if min(args.taxa) < 4 or args.trees < 1 or args.topologies < 1:
+        print "ERROR: At least 4 taxa, one tree and one topology are needed."
+        sys.exit()
+    stages = available_stages(args.stages)
+    skipped = [stage for stage in args.stages if stage not in stages]
+    if skipped:
+        sys.stderr.write("Skipped stages, engine is not installed: {0}\n".format(
+            ", ".join(skipped)))
+    rooted = args.style == "beast"
+    directory = args.keep or tempfile.mkdtemp(prefix="BayesMonophyly")
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    records = []
+    print("\t".join(["taxa", "trees", "stage", "seconds", "trees_per_second",
+                     "peak_memory_mb", "check"]))
+    try:
+        for num_taxa in args.taxa:
+            treefile = os.path.join(directory, "{0}_{1}_{2}.t".format(
+                args.style, num_taxa, args.trees))
+            #sample is generated in its own process, so that stages do not
+            #inherit memory of its topologies
+            (groups, query_topology) = run_stage(
+                generate_sample, treefile, num_taxa, args.trees, args.style,
+                args.annotations, args.topologies, args.groups,
+                args.seed)[0]
+            records.extend(benchmark(treefile, num_taxa, args.trees, rooted,
+                                     groups, query_topology, stages,
+                                     args.max_memory))
+    finally:
+        if not args.keep:
+            shutil.rmtree(directory)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"style": args.style, "annotations": args.annotations,
+                       "topologies": args.topologies, "groups": args.groups,
+                       "seed": args.seed, "python": sys.version.split()[0],
+                       "results": records}, output, indent=1,
+                      sort_keys=True)
+    if any(record["check"] == "MISMATCH" for record in records):
+        sys.stderr.write("Results of some stages do not match.\n")
+        sys.exit(1)
+    if any(record["check"] == "OVER_MEMORY" for record in records):
+        sys.stderr.write("Some stages exceeded memory limit.\n")
+        sys.exit(1)
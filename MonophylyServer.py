@@ -0,0 +1,383 @@
+#!/usr/bin/env python
+"""This script holds posterior tree samples in memory and answers queries
+for monophyly, Bayes factor and frequency of topologies over HTTP."""
+from __future__ import division
+import sys
+import os
+import json
+import urlparse
+import itertools
+import traceback
+import collections
+import BaseHTTPServer
+import SocketServer
+import BayesMonophyly as bm
+import PosteriorTopology as pt
+
+def parse_args():
+    import argparse as arg
+    parser = arg.ArgumentParser(
+        prog="MonophylyServer",
+        description=(
+            "Hold posterior tree samples in memory and answer queries for"
+            " monophyly, Bayes factor and frequency of topologies, so that"
+            " sample is parsed only once for many queries. Queries are HTTP"
+            " GET requests on localhost or Unix socket and answers are JSON:"
+            " /monophyly?file=run1.t&file=run2.t&species=A,B,C&burnin=0.25"
+            " (species can be repeated for more groups),"
+            " /topology?file=run1.t&tree=((A,B),C,D) (tree can be repeated),"
+            " /load?file=run1.t and /samples. Optional parameters are"
+            " burnin (0.2 by default), thin and rooted (yes or no)."
+            )
+        )
+    address = parser.add_mutually_exclusive_group()
+    address.add_argument(
+        "-p", "--port", required=False, default=8765, type=int,
+        help="Port on localhost (127.0.0.1) on which queries are accepted."
+        )
+    address.add_argument(
+        "--socket", required=False,
+        help="Accept queries on Unix socket with this path instead of port."
+        )
+    parser.add_argument(
+        "--memory", required=False, default=1024, type=float,
+        help=(
+            "Memory budget in MB. When estimated size of loaded samples"
+            " exceeds it, the least recently used samples are removed"
+            " from memory."
+            )
+        )
+    parser.add_argument(
+        "--no-cache", required=False, default=False,
+        action="store_true",
+        help="Do not use or create cache of parsed posterior tree samples."
+        )
+    args = parser.parse_args()
+    return(args)
+
+
+class QueryError(Exception):
+    """Query that can't be answered."""
+    pass
+
+
+class LoadedSample(object):
+    """Posterior tree sample held in memory.
+
+    Sample is held in the same compact form as in cache (see
+    BayesMonophyly.cached_tree_sample). Weighted trees (see
+    BayesMonophyly.parse_weighted_tree_file) list every distinct topology
+    only once, so they are held as clades of every tree with its weight
+    and they are not cached. For every combination of burnin,
+    thinning and rootedness, split table (see BayesMonophyly.split_table)
+    and counts of topologies are computed once from counts of distinct
+    topologies, so that every following query is only lookup.
+    """
+    def __init__(self, treefile, use_cache=True):
+        self.key = bm.tree_file_key(treefile)
+        self.weights = None
+        if bm.is_weighted_tree_file(treefile):
+            (self.translated_taxa,
+             weighted_trees) = bm.parse_weighted_tree_file(treefile)
+            weighted_trees = list(weighted_trees)
+            self.topologies = [bm.tree_clades(tree)
+                               for tree, weight in weighted_trees]
+            self.weights = [weight for tree, weight in weighted_trees]
+            self.tree_topologies = range(len(self.topologies))
+        else:
+            if use_cache:
+                sample = bm.cached_tree_sample(treefile)
+            else:
+                sample = bm.parse_tree_sample(treefile)
+            (self.translated_taxa, self.topologies,
+             self.tree_topologies) = sample
+        self.tables = dict()
+
+    def is_stale(self, treefile):
+        return(bm.tree_file_key(treefile) != self.key)
+
+    def topology_counts(self, burnin, thin):
+        """Return number of trees of every distinct topology after burnin
+        and total number of trees. For weighted trees, weights of trees are
+        summed instead and burnin is not applied, as in BayesMonophyly."""
+        if self.weights is not None:
+            counts = collections.Counter()
+            for index, weight in zip(self.tree_topologies, self.weights):
+                counts[index] += weight
+            return(counts, sum(self.weights))
+        burnin = bm.burnin_trees(len(self.tree_topologies), burnin, thin)
+        counts = collections.Counter(itertools.islice(
+            self.tree_topologies, burnin, None, thin))
+        return(counts, sum(counts.itervalues()))
+
+    def tables_for(self, burnin, thin, rooted):
+        """Return split table, counts of topologies (by their canonical
+        representation, see BayesMonophyly.topology_key) and total number
+        of trees, computed only once for every burnin, thinning and
+        rootedness."""
+        key = (burnin, thin, rooted)
+        if key not in self.tables:
+            (counts, num_total) = self.topology_counts(burnin, thin)
+            split_table = collections.Counter()
+            key_counts = collections.Counter()
+            for index, count in counts.iteritems():
+                clades = self.topologies[index]
+                for split in bm.tree_splits(clades, rooted):
+                    split_table[split] += count
+                key_counts[bm.topology_key(clades, rooted)] += count
+            self.tables[key] = (split_table, key_counts, num_total)
+        return(self.tables[key])
+
+    def size(self):
+        """Return estimated size of sample in memory in bytes."""
+        if self.weights is not None:
+            #tuple of clades of every tree
+            size = sum(100 + 40 * len(clades) for clades in self.topologies)
+        else:
+            size = (self.topologies.parents.itemsize *
+                    len(self.topologies.parents) +
+                    self.topologies.offsets.itemsize *
+                    len(self.topologies.offsets) +
+                    self.tree_topologies.itemsize *
+                    len(self.tree_topologies) +
+                    #dictionary of hashes of distinct topologies
+                    120 * len(self.topologies))
+        num_splits = max(len(self.translated_taxa) - 3, 1)
+        for split_table, key_counts, num_total in self.tables.itervalues():
+            size += (100 * len(split_table) +
+                     (100 + 40 * num_splits) * len(key_counts))
+        return(size)
+
+
+class SampleStore(object):
+    """Loaded tree samples, the least recently used of which are removed
+    when their estimated size exceeds memory budget in bytes."""
+    def __init__(self, budget, use_cache=True):
+        self.budget = budget
+        self.use_cache = use_cache
+        self.samples = collections.OrderedDict()
+
+    def get(self, treefile):
+        """Return loaded sample of tree file, which is loaded again if file
+        changed since it was loaded."""
+        path = os.path.abspath(treefile)
+        sample = self.samples.pop(path, None)
+        if sample is None or sample.is_stale(path):
+            sample = LoadedSample(path, self.use_cache)
+        self.samples[path] = sample
+        return(sample)
+
+    def evict(self):
+        """Remove the least recently used samples until they fit into
+        budget. The most recently used sample is always kept."""
+        while (len(self.samples) > 1 and
+               sum(sample.size() for sample in self.samples.itervalues()) >
+               self.budget):
+            self.samples.popitem(last=False)
+
+    def description(self):
+        return([{"file": path, "trees": len(sample.tree_topologies),
+                 "topologies": len(sample.topologies),
+                 "weighted": sample.weights is not None,
+                 "taxa": len(sample.translated_taxa),
+                 "size_mb": sample.size() / 1024**2}
+                for path, sample in self.samples.iteritems()])
+
+
+def query_settings(query, rooted=False):
+    """Return burnin, thinning and rootedness from query, with rooted as
+    default rootedness."""
+    try:
+        #burnin is 20% of trees by default, as in BayesMonophyly
+        burnin = float(query.get("burnin", ["0.2"])[0])
+        thin = int(query.get("thin", ["1"])[0])
+        rooted = query.get("rooted", [str(rooted)])[0].lower() in [
+            "yes", "true", "1"]
+    except ValueError:
+        raise QueryError("Burnin must be number and thin integer.")
+    if burnin < 0 or thin < 1:
+        raise QueryError("Burnin can't be negative and thinning must be"
+                         " positive.")
+    return(burnin, thin, rooted)
+
+
+def query_samples(store, query):
+    """Return loaded samples of all files in query."""
+    files = query.get("file")
+    if not files:
+        raise QueryError("No file given.")
+    samples = [store.get(treefile) for treefile in files]
+    if len(set(sample.weights is None for sample in samples)) > 1:
+        raise QueryError("Weighted and unweighted tree files can't be"
+                         " combined.")
+    bm.check_species_equivalency([sample.translated_taxa
+                                  for sample in samples])
+    return(samples)
+
+
+def monophyly_query(store, query):
+    """Answer query for monophyly of groups of species, with the same
+    results as BayesMonophyly, but without Monte Carlo error, as order of
+    trees is not kept."""
+    (burnin, thin, rooted) = query_settings(query)
+    groups = [(species, species.replace(",", " ").split())
+              for species in query.get("species", [])]
+    if not groups:
+        raise QueryError("No species given.")
+    for name, species in groups:
+        try:
+            bm.check_species_group(species)
+        except ValueError as error:
+            raise QueryError(str(error))
+    samples = query_samples(store, query)
+    translated_taxa = samples[0].translated_taxa
+    for name, species in groups:
+        bm.check_species_in_taxa(species, translated_taxa)
+    species_groups = [bm.translate_species(translated_taxa, species)
+                      for name, species in groups]
+    monophyletic_counters = [0] * len(groups)
+    num_total = 0
+    for sample in samples:
+        (split_table, key_counts,
+         sample_total) = sample.tables_for(burnin, thin, rooted)
+        counters = bm.table_solution(split_table, sample_total,
+                                     species_groups, translated_taxa, rooted)
+        monophyletic_counters = [count + sample_count for count, sample_count
+                                 in zip(monophyletic_counters, counters)]
+        num_total += sample_total
+    if not num_total:
+        raise QueryError("No trees left after burnin.")
+    results = bm.monophyly_results(groups, monophyletic_counters, num_total,
+                                   len(translated_taxa), rooted)
+    return({"trees": num_total,
+            "groups": [result.as_dict() for result in results]})
+
+
+def topology_query(store, query):
+    """Answer query for frequency of topologies of trees, with the same
+    results as PosteriorTopology, which compares trees as rooted by
+    default."""
+    (burnin, thin, rooted) = query_settings(query, rooted=True)
+    tree_texts = [bm.strip_newick(tree.strip().rstrip(";"))
+                  for tree in query.get("tree", [])]
+    if not tree_texts:
+        raise QueryError("No tree given.")
+    samples = query_samples(store, query)
+    taxa_dict = samples[0].translated_taxa
+    inverted_dict = pt.invert_dict(taxa_dict)
+    query_keys = []
+    for tree_text in tree_texts:
+        tree_node_labels = pt.get_node_names(tree_text)
+        if len(tree_node_labels) != len(taxa_dict):
+            raise QueryError("Tree {0} and trees in posterior tree sample"
+                             " have a different number of taxa.".format(
+                                 tree_text))
+        pt.check_species_in_taxa(tree_node_labels, taxa_dict)
+        query_keys.append(bm.topology_key(bm.tree_clades(
+            pt.recode_tree(tree_text, inverted_dict)), rooted))
+    topology_counts = [0] * len(query_keys)
+    num_total = 0
+    for sample in samples:
+        (split_table, key_counts,
+         sample_total) = sample.tables_for(burnin, thin, rooted)
+        for num, key in enumerate(query_keys):
+            topology_counts[num] += key_counts[key]
+        num_total += sample_total
+    if not num_total:
+        raise QueryError("No trees left after burnin.")
+    return({"trees": num_total,
+            "topologies": [{"tree": tree_text, "trees_with_topology": count,
+                            "posterior": count / num_total}
+                           for tree_text, count in zip(tree_texts,
+                                                       topology_counts)]})
+
+
+def load_query(store, query):
+    """Load samples of files in query in advance."""
+    query_samples(store, query)
+    store.evict()
+    return({"samples": store.description()})
+
+
+QUERIES = {
+    "/monophyly": monophyly_query,
+    "/topology": topology_query,
+    "/load": load_query,
+    "/samples": lambda store, query: {"samples": store.description()},
+    }
+
+
+class QueryHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answer GET request with JSON, errors have status 400, 404 or 500."""
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        query = urlparse.parse_qs(url.query)
+        store = self.server.store
+        if url.path not in QUERIES:
+            self.send_answer({"error": "Unknown query {0}, use one of"
+                              " {1}.".format(url.path,
+                                             ", ".join(sorted(QUERIES)))},
+                             404)
+            return
+        try:
+            answer = QUERIES[url.path](store, query)
+            status = 200
+        except (QueryError, bm.ParsingError, pt.TaxaError, RuntimeError,
+                ValueError) as error:
+            (answer, status) = ({"error": str(error)}, 400)
+        except Exception as error:
+            #bug in query is reported, but server keeps running
+            self.log_error("%s", traceback.format_exc())
+            (answer, status) = ({"error": "Internal error: {0!r}".format(
+                error)}, 500)
+        finally:
+            store.evict()
+        self.send_answer(answer, status)
+
+    def send_answer(self, answer, status):
+        """Send answer as JSON with given status."""
+        #standard JSON has no infinity, see BayesMonophyly.json_value
+        body = json.dumps(bm.json_value(answer), sort_keys=True)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class UnixHTTPServer(SocketServer.UnixStreamServer):
+    """HTTP server on Unix socket."""
+    def server_bind(self):
+        SocketServer.UnixStreamServer.server_bind(self)
+        (self.server_name, self.server_port) = ("localhost", 0)
+
+    def get_request(self):
+        #client of Unix socket has no address, which is used in log
+        (request, client_address) = self.socket.accept()
+        return(request, ("local", 0))
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.memory <= 0:
+        print "ERROR: Memory budget must be positive."
+        sys.exit()
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = UnixHTTPServer(args.socket, QueryHandler)
+        address = args.socket
+    else:
+        server = BaseHTTPServer.HTTPServer(("127.0.0.1", args.port),
+                                           QueryHandler)
+        address = "http://127.0.0.1:{0}".format(args.port)
+    server.store = SampleStore(args.memory * 1024**2, not args.no_cache)
+    sys.stderr.write("Answering queries on {0}\n".format(address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            os.remove(args.socket)
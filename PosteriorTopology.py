@@ -1,18 +1,25 @@
-"""This script reads tree in newick format and posterior tree sample from
+"""This script reads trees in newick format and posterior tree sample from
 MrBayes or BEAST and outputs number (and ratio) of trees that have the same
 topology."""
 
 from __future__ import division
 import sys
+import atexit
 import re
 import math
-import argparse as arg
-try:
-    import ete2
-except ImportError:
-    raise ImportError("This script require ete2. Please, make sure it is installed.")
+import itertools
+import collections
+import heapq
+from BayesMonophyly import cached_tree_sample, tree_clades, CACHE_SUFFIX
+from BayesMonophyly import TopologyMemo, topology_key, splits_newick
+from BayesMonophyly import MEMO_SIZE
+from BayesMonophyly import is_weighted_tree_file, parse_weighted_tree_file
+from BayesMonophyly import format_count
+from BayesMonophyly import strip_newick, profiler
+from BayesMonophyly import ParsingError, parse_tree_file
 
 def parse_args():
+    import argparse as arg
     parser = arg.ArgumentParser(
         prog="PosteriorTopology",
         description=(
@@ -22,131 +29,111 @@ def parse_args():
             " testing for topology with bayesian posterior tree sample."
             )
         )
-    parser.add_argument(
-        "-t", "--tree", required=True,
+    query = parser.add_mutually_exclusive_group(required=True)
+    query.add_argument(
+        "-t", "--tree", nargs="+",
+        help=(
+            "One or more files with tree topologies in newick format,"
+            " one tree per line. Branch lenghts are ignored. All trees"
+            " are counted with a single reading of posterior tree sample."
+            )
+        )
+    query.add_argument(
+        "-c", "--credible", type=float,
         help=(
-            "Tree topology in newick format. Branch lenghts are ignored."
+            "Instead of searching for given trees, count all topologies in"
+            " posterior tree sample and output the most frequent ones"
+            " together with credible set of topologies of this probability"
+            " (e.g. 0.95)."
             )
         )
     parser.add_argument(
         "-p", "--posterior", required=True,
         help=(
             "MrBayes or BEAST posterior tree samples from bayesian tree"
-            " analysis."
+            " analysis. Weighted trees ([&W weight] before every tree),"
+            " such as .trprobs file from MrBayes sumt, are also accepted."
+            )
+        )
+    parser.add_argument(
+        "-u", "--unrooted", required=False, default=False,
+        action="store_true",
+        help=(
+            "Will treat trees as unrooted (e.g. MrBayes), so that trees"
+            " differing only in position of root have the same topology."
+            " Trees are compared as rooted by default."
+            )
+        )
+    parser.add_argument(
+        "-e", "--engine", required=False, default="hash",
+        choices=["hash", "ete2"],
+        help=(
+            "Method used to compare topologies. Native \"hash\" compares"
+            " canonical sets of splits and does not require ete2,"
+            " \"ete2\" computes Robinson-Foulds distance for every tree"
+            " and is kept for comparison."
+            )
+        )
+    parser.add_argument(
+        "--no-cache", required=False, default=False,
+        action="store_true",
+        help=(
+            "Do not use or create cache of parsed posterior tree sample."
+            " By default, posterior tree sample is parsed only once and"
+            " saved into binary file with suffix \"{0}\" next to it, which"
+            " is used until posterior tree sample changes. Cache is shared"
+            " with BayesMonophyly.".format(CACHE_SUFFIX)
+            )
+        )
+    parser.add_argument(
+        "--memo-size", required=False, default=50, type=float,
+        help=(
+            "Memory in MB for results of comparison of the most recently"
+            " seen distinct trees, which are remembered and reused when the"
+            " same tree is sampled again (cache holds distinct topologies"
+            " already, so this is used only when cache is not). Zero"
+            " disables memoization."
+            )
+        )
+    parser.add_argument(
+        "-k", "--top", required=False, default=10, type=int,
+        help=(
+            "Number of the most frequent topologies printed with"
+            " --credible, zero prints whole credible set."
+            )
+        )
+    parser.add_argument(
+        "--max-topologies", required=False, default=10000, type=int,
+        help=(
+            "Maximum number of distinct topologies counted with --credible"
+            " when posterior tree sample is not cached. If there are more"
+            " distinct topologies, counts of the most frequent ones are"
+            " only approximate (but never underestimated)."
+            )
+        )
+    parser.add_argument(
+        "--profile", required=False, default=False,
+        action="store_true",
+        help=(
+            "Print wall time, number of trees per second and peak memory of"
+            " every stage of run (reading, stripping of comments and branch"
+            " lengths, cache, ete2 trees and counting of topologies) to"
+            " stderr."
             )
         )
+    parser.add_argument(
+        "--profile-json", required=False,
+        help="Save profile also as JSON into file (implies --profile)."
+        )
     args = parser.parse_args()
     return(args)
 
 
-class ParsingError(Exception):
-    """Unexpected string while parsing file."""
-    pass
-
-
 class TaxaError(Exception):
     """Different taxa or number of taxa in trees."""
     pass
 
 
-def parse_posterior_sample(treefile):
-    """Parse posterior tree sample file from BEAST or MrBayes.
-
-    Parse posterior tree sample file generated by MrBayes or BEAST software.
-    These files are of NEXUS format and contain several block. Of these blocks,
-    only the Translate and Tree blocks are of interest. Translate block contain
-    list of species in trees and their translation, as names are translated
-    into numbers. Tree block contains posterior sample of trees.
-
-    This parser will search this file and returns Translate block and trees.
-    There are several checks employed to ensure, that parsing is correct.
-
-    Parameters
-    ----------
-    treefile : string
-        path to file that is to be parsed
-
-    Returns
-    -------
-    translated_taxa : dictionary
-        original names of species in file and their numeric translation
-    """
-    tree_file_text = []
-    try:
-        tree_file = open(treefile,"r")
-    except IOError:
-        raise ParsingError("ERROR: Couldn't open file, does file exists?")
-    else:
-        with tree_file:
-            tree_file_text = tree_file.readlines()
-    #Various checks:
-    #first line must be #NEXUS
-    if(tree_file_text[0].strip("\n\t ").lower() != "#nexus"):
-        raise ParsingError("ERROR: No NEXUS header. Is file NEXUS?")
-
-    #find begin trees
-    begin_block_start = 0
-    for num,line in enumerate(tree_file_text):
-        if line.strip("\n\t ").lower() == "begin trees;":
-            begin_block_start=num
-            break
-    if begin_block_start == 0:
-        raise ParsingError("ERROR: Begin trees block not found!")
-
-    #check if following one is translate:
-    if tree_file_text[begin_block_start+1].strip("\n\t ").lower() != "translate":
-        raise ParsingError(
-                "ERROR: Misformed Begin trees block,"
-                " \"translate\" not found."
-                )
-
-    #translate block, numbers from 1 to ntaxa
-    #but because taxa block is not required 
-    #number of taxa is not known and must be estimated from translate
-    translated_taxa = dict()
-    begin_block_end = 0
-    for num,line in enumerate(tree_file_text[begin_block_start+2 : ]):
-        pair = line.strip("\n\t, ").split()
-        if len(pair) != 2:
-            begin_block_end = num + begin_block_start + 2
-            break
-        else:
-            translated_taxa[int(pair[0]) ] = pair[1]
-    #check if begin_block_end has changed:
-    if begin_block_end == 0:
-        raise ParsingError("ERROR: end of translation block not found.")
-
-    #now, every tree should start with "tree", so find a first tree, if not next:
-    trees_start = 0
-    for num,line in enumerate(tree_file_text[begin_block_end + 1 : ]):
-        if line.strip("\n\t ")[0:4].lower() == "tree":
-            trees_start = num + begin_block_end + 1
-            break
-    #test if trees_start changed:
-    if trees_start == 0:
-        raise ParsingError("ERROR: no tree was found!")
-    trees = []
-    #read all trees and put them into list
-    for line in tree_file_text[trees_start:]:
-        #get tree
-        line=line.strip("\n\t ;")
-        if line.lower() == "end":
-            #end of tree block
-            break
-        tree=line.split(" = ")[1].strip()
-        if(tree[0:5] == "[&U] "): #remove "[&U] ", if present
-            tree = tree[5:]
-        #delete [&something=number] tags from BEAST
-        #TODO better matching is required
-        #in my file, I am currently matching only [&rate=number]
-        if "[" in tree:
-            tree = re.sub("\[&\w+=[0-9]*\.?[0-9]*([eE]-[0-9]+)?\]", "", tree)
-        #get cladogram
-        tree = re.sub(":[0-9]+\.?[0-9]*([eE]-[0-9]+)?", "", tree)
-        trees.append(tree)
-    return(translated_taxa, trees)
-
-
 def check_species_in_taxa(node_names,translated_taxa):
     """Check if specified species are in dictionary.
 
@@ -178,15 +165,19 @@ def invert_dict(dictionary):
 
 
 def parse_treefile(treefile):
+    """Return list of trees in newick format from file, one tree per line,
+    without comments and branch lengths."""
     try:
         tree_file = open(treefile,"r")
     except IOError:
         raise ParsingError("ERROR: Couldn't open file, does file exists?")
     else:
         with tree_file:
-            tree_text = tree_file.readlines()[0].rstrip("\n")
-    tree_text = re.sub(":[0-9]+\.?[0-9]*([eE]-[0-9]+)?", "", tree_text)
-    return(tree_text)
+            tree_texts = [line.strip() for line in tree_file if line.strip()]
+    if not tree_texts:
+        raise ParsingError("ERROR: No tree found in file {0}.".format(treefile))
+    tree_texts = [strip_newick(tree_text) for tree_text in tree_texts]
+    return(tree_texts)
 
 
 def get_node_names(tree_text):
@@ -196,48 +187,379 @@ def get_node_names(tree_text):
 
 
 def recode_tree(tree_text, reverted_dict):
-    recoded_tree = reduce(
-        lambda x, kv: x.replace(*kv), reverted_dict.iteritems(), tree_text
+    """Replace names of taxa in tree with their numbers.
+
+    Whole names are replaced, so that name which is prefix of another name
+    does not corrupt it."""
+    recoded_tree = re.sub(
+        "[^(),;\s]+", lambda match: reverted_dict.get(match.group(0),
+                                                      match.group(0)),
+        tree_text
         )
     return(recoded_tree)
 
 
-def count_trees(recoded_tree, posterior_trees):
-    topology_count = 0
-    tree = ete2.Tree(recoded_tree)
-    for posterior_tree in posterior_trees:
+def count_trees(recoded_trees, posterior_trees, memo, rooted, weights=None):
+    """Return number of trees with the same topology as each of
+    recoded_trees and total number of trees, using ete2.
+
+    Posterior trees are consumed one by one and comparison is memoized for
+    repeated trees (see BayesMonophyly.TopologyMemo). If weights of trees
+    are given, trees are counted by their weights."""
+    try:
+        import ete2
+    except ImportError:
+        raise ImportError("Engine ete2 requires ete2. Please, make sure it"
+                          " is installed.")
+    trees = [ete2.Tree(recoded_tree) for recoded_tree in recoded_trees]
+    if weights is None:
+        weights = itertools.repeat(1)
+    topology_counts = [0] * len(trees)
+    total_trees = 0
+    def same_topology(posterior_tree):
         try:
-            posterior = ete2.Tree(posterior_tree + ";")
+            with profiler.stage("ete2_trees"):
+                posterior = ete2.Tree(posterior_tree + ";")
         except ete2.parser.newick.NewickError:
-            print posterior_tree
-            raise RuntimeError("ERROR: Problem with turning text"
-                               " into tree with ete2!")
-        result = tree.compare(posterior)
-        if(result["rf"] == 0):
-            topology_count+=1
-    return(topology_count)
+            raise RuntimeError("Problem with turning text into tree with"
+                               " ete2: {0}".format(posterior_tree))
+        return([tree.compare(posterior, unrooted=not rooted)["rf"] == 0
+                for tree in trees])
+    for posterior_tree, weight in itertools.izip(posterior_trees, weights):
+        total_trees += weight
+        for num, same in enumerate(memo.evaluate(posterior_tree,
+                                                 same_topology)):
+            if same:
+                topology_counts[num] += weight
+    return(topology_counts, total_trees)
+
+
+def count_topologies(query_keys, posterior_trees, memo, rooted,
+                     weights=None):
+    """Return number of trees with each of query topologies and total
+    number of trees.
+
+    Every posterior tree is reduced to canonical representation of its
+    topology (see BayesMonophyly.topology_key), so that comparison of
+    topologies is only dictionary lookup. Canonical representation is
+    memoized for repeated trees (see BayesMonophyly.TopologyMemo).
 
+    Parameters
+    ----------
+    query_keys : list of tuples
+        canonical representations of query topologies
+    posterior_trees : iterable of strings
+        trees, cladograms in text form
+    memo : TopologyMemo
+        memo of canonical representation of repeated trees
+    rooted : bool
+        whether trees are rooted
+    weights : iterable of floats, optional
+        weight of every tree, every tree is counted once if not given
 
-if __name__ == "__main__":
-    args = parse_args()
-    tree_text = parse_treefile(args.tree)
-    tree_node_labels = get_node_names(tree_text)
+    Returns
+    -------
+    topology_counts : list of ints or floats
+        number (or weight) of trees for every query topology
+    total_trees : int or float
+        number (or weight) of trees
+    """
+    if weights is None:
+        weights = itertools.repeat(1)
+    counts = dict.fromkeys(query_keys, 0)
+    total_trees = 0
+    to_key = lambda tree: topology_key(tree_clades(tree), rooted)
+    for posterior_tree, weight in itertools.izip(posterior_trees, weights):
+        total_trees += weight
+        key = memo.evaluate(posterior_tree, to_key)
+        if key in counts:
+            counts[key] += weight
+    return([counts[key] for key in query_keys], total_trees)
+
+
+def count_cached_topologies(query_keys, topologies, tree_topologies, rooted):
+    """Return number of trees with each of query topologies and total
+    number of trees from cached posterior tree sample.
+
+    Canonical representation of topology (see BayesMonophyly.topology_key)
+    is computed only once for every distinct topology from cache (see
+    BayesMonophyly.cached_tree_sample).
+    """
+    counts = collections.Counter()
+    for index, count in collections.Counter(tree_topologies).iteritems():
+        counts[topology_key(topologies[index], rooted)] += count
+    return([counts[key] for key in query_keys], len(tree_topologies))
+
+
+class TopologyCounter(object):
+    """Approximate counter of the most frequent topologies in bounded memory.
 
-    (taxa_dict, posterior_trees) = parse_posterior_sample(args.posterior)
-    #test dimension of taxa:
-    if len(tree_node_labels) != len(taxa_dict):
-        raise TaxaError("ERROR: Input tree and trees in posterior tree sample"
-                        " have a different number of taxa!")
-    #test if all taxa match:
-    check_species_in_taxa(tree_node_labels, taxa_dict)
+    Counter holds at most capacity topologies. When new topology is
+    encountered and counter is full, the least frequent topology is replaced
+    and new one inherits its count (Space-Saving algorithm of Metwally et al.
+    2005). Any topology more frequent than total/capacity is therefore kept
+    and its count is overestimated by at most its recorded error. While
+    there are no more distinct topologies than capacity, counts are exact.
+    """
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = dict()
+        self.errors = dict()
+        #heap of (count, topology), entries are updated lazily
+        self.heap = []
+        self.total = 0
+
+    def add(self, topology, weight=1):
+        """Count one tree with topology, or its weight for weighted trees."""
+        self.total += weight
+        if topology in self.counts:
+            self.counts[topology] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[topology] = weight
+            self.errors[topology] = 0
+            heapq.heappush(self.heap, (weight, topology))
+            return
+        while True:
+            (count, evicted) = heapq.heappop(self.heap)
+            if self.counts[evicted] == count:
+                break
+            heapq.heappush(self.heap, (self.counts[evicted], evicted))
+        del self.counts[evicted]
+        del self.errors[evicted]
+        self.counts[topology] = count + weight
+        self.errors[topology] = count
+        heapq.heappush(self.heap, (count + weight, topology))
+
+    def approximate(self):
+        """Return True if some count is only approximate."""
+        return(any(self.errors.itervalues()))
+
+    def most_common(self):
+        """Return list of topologies and their counts, from the most
+        frequent one."""
+        return(sorted(self.counts.iteritems(), key=lambda item: item[1],
+                      reverse=True))
+
+
+def credible_set(topology_counts, total_trees, probability):
+    """Return number of the most frequent topologies, which form credible
+    set of given probability, i.e., the smallest set of topologies whose
+    posterior probabilities sum to at least given probability.
+
+    Parameters
+    ----------
+    topology_counts : list of tuples
+        topologies and their counts, sorted from the most frequent one
+    total_trees : int
+        number of trees
+    probability : float
+        probability of credible set
+    """
+    cumulative = 0
+    for num, (topology, count) in enumerate(topology_counts):
+        cumulative += count
+        if cumulative / total_trees >= probability:
+            return(num + 1)
+    return(len(topology_counts))
+
+
+def print_credible_set(topology_counts, total_trees, probability, top,
+                       translated_taxa):
+    """Print the most frequent topologies and their posterior probability
+    as tab-separated table, followed by size of credible set."""
+    credible_size = credible_set(topology_counts, total_trees, probability)
+    shown = top if top > 0 else credible_size
+    print("\t".join(["rank", "trees", "posterior", "cumulative", "credible",
+                     "tree"]))
+    cumulative = 0
+    for num, (topology, count) in enumerate(topology_counts[:shown]):
+        cumulative += count
+        print("\t".join([str(num + 1), format_count(count),
+                         "{0:.4g}".format(count/total_trees),
+                         "{0:.4g}".format(cumulative/total_trees),
+                         "yes" if num < credible_size else "no",
+                         splits_newick(topology, translated_taxa)]))
+    print("\nTrees total: {0}\n"
+          "Distinct topologies counted: {1}\n"
+          "Topologies in {2:.4g} credible set: {3}\n".format(
+              format_count(total_trees), len(topology_counts), probability,
+              credible_size))
+
+
+def read_posterior_sample(posterior, use_cache=True, memo_size=MEMO_SIZE):
+    """Read posterior tree sample, either from cache (see
+    BayesMonophyly.cached_tree_sample, which parses tree file with memo of
+    memo_size bytes) or as trees in text form.
+
+    Weighted tree files list every distinct tree only once, so they are
+    never cached.
+
+    Returns
+    -------
+    taxa_dict : dictionary
+        original names of species in file and their numeric translation
+    sample : tuple or None
+        distinct topologies and topology of every tree from cache, None if
+        cache is not used
+    trees : iterable of strings or None
+        trees, cladograms in text form, None if cache is used
+    weights : list of floats or None
+        weights of trees, None if trees are not weighted
+    """
+    if is_weighted_tree_file(posterior):
+        (taxa_dict, weighted_trees) = parse_weighted_tree_file(posterior)
+        weighted_trees = list(weighted_trees)
+        return(taxa_dict, None, [tree for tree, weight in weighted_trees],
+               [weight for tree, weight in weighted_trees])
+    if use_cache:
+        (taxa_dict, topologies, tree_topologies) = cached_tree_sample(
+            posterior, memo_size=memo_size)
+        return(taxa_dict, (topologies, tree_topologies), None, None)
+    (taxa_dict, trees) = parse_tree_file(posterior)
+    return(taxa_dict, None, trees, None)
+
+
+def posterior_topologies(tree_texts, posterior, rooted=True, engine="hash",
+                         use_cache=True, memo=None):
+    """Return number of trees in posterior tree sample with topology of
+    each of tree_texts and total number of trees.
+
+    This is what PosteriorTopology does with input trees, for use from other
+    Python programs. Errors are raised as exceptions and nothing is printed.
 
+    Parameters
+    ----------
+    tree_texts : list of strings
+        trees in Newick format with names of taxa, without comments and
+        branch lengths (see parse_treefile)
+    posterior : string
+        path to posterior tree sample
+    rooted : bool
+        whether trees are compared as rooted (default, as ete2 compares
+        them), otherwise trees differing only in position of root have the
+        same topology
+    engine : string
+        "hash" or "ete2", ete2 never uses cache
+    use_cache : bool
+        whether cache of parsed posterior tree sample is used and created
+    memo : TopologyMemo, optional
+        memo of repeated trees, for its statistics
+
+    Returns
+    -------
+    topology_counts : list of ints or floats
+        number (or weight) of trees for every input tree
+    total_trees : int or float
+        number (or weight) of trees
+    """
+    if memo is None:
+        memo = TopologyMemo()
+    (taxa_dict, sample, posterior_trees, weights) = read_posterior_sample(
+        posterior, use_cache and engine != "ete2", memo.maxsize)
     inverted_dict = invert_dict(taxa_dict)
-    recoded_tree = recode_tree(tree_text, inverted_dict)
-    topology_count = count_trees(recoded_tree, posterior_trees)
-    total_trees = len(posterior_trees)
-    output = (
-        "Trees total: {0}\n"
-        "Trees with input topology: {1}\n"
-        "Posterior probability: {2:.4g}\n").format(total_trees, topology_count,
-                             topology_count/total_trees)
-    print(output)
+    recoded_trees = []
+    for tree_text in tree_texts:
+        tree_node_labels = get_node_names(tree_text)
+        #test dimension of taxa:
+        if len(tree_node_labels) != len(taxa_dict):
+            raise TaxaError("ERROR: Input tree and trees in posterior tree"
+                            " sample have a different number of taxa!")
+        #test if all taxa match:
+        check_species_in_taxa(tree_node_labels, taxa_dict)
+        recoded_trees.append(recode_tree(tree_text, inverted_dict))
+
+    query_keys = [topology_key(tree_clades(recoded_tree), rooted)
+                  for recoded_tree in recoded_trees]
+    if weights is not None:
+        #every distinct tree is listed only once
+        memo.maxsize = 0
+    with profiler.stage("topology"):
+        if sample is not None:
+            (topology_counts, total_trees) = count_cached_topologies(
+                query_keys, sample[0], sample[1], rooted)
+        elif engine == "ete2":
+            (topology_counts, total_trees) = count_trees(
+                recoded_trees, posterior_trees, memo, rooted, weights)
+        else:
+            (topology_counts, total_trees) = count_topologies(
+                query_keys, posterior_trees, memo, rooted, weights)
+        profiler.add_trees("topology", total_trees if weights is None
+                           else len(weights))
+    return(topology_counts, total_trees)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.profile or args.profile_json:
+        profiler.enable()
+        atexit.register(lambda: sys.stderr.write(
+            profiler.report(args.profile_json)))
+    #memo size is given in MB
+    memo_size = int(args.memo_size * 1024**2)
+    rooted = not args.unrooted
+
+    if args.credible is not None:
+        if not 0 < args.credible <= 1:
+            print "ERROR: Probability of credible set must be in (0, 1]."
+            sys.exit()
+        (taxa_dict, sample, posterior_trees,
+         weights) = read_posterior_sample(args.posterior, not args.no_cache,
+                                          memo_size)
+        profiler.switch("topology")
+        if sample is not None:
+            #cache holds all distinct topologies, so counts are exact
+            (topologies, tree_topologies) = sample
+            counts = collections.Counter()
+            for index, count in collections.Counter(
+                    tree_topologies).iteritems():
+                counts[topology_key(topologies[index], rooted)] += count
+            topology_counts = counts.most_common()
+            total_trees = len(tree_topologies)
+        else:
+            #weighted trees list every distinct tree only once
+            memo = TopologyMemo(memo_size if weights is None else 0)
+            counter = TopologyCounter(args.max_topologies)
+            to_key = lambda tree: topology_key(tree_clades(tree), rooted)
+            for posterior_tree, weight in itertools.izip(
+                    posterior_trees, weights or itertools.repeat(1)):
+                counter.add(memo.evaluate(posterior_tree, to_key), weight)
+            sys.stderr.write(memo.report())
+            if counter.approximate():
+                sys.stderr.write("More than {0} distinct topologies, counts"
+                                 " are approximate.\n".format(
+                                     args.max_topologies))
+            topology_counts = counter.most_common()
+            total_trees = counter.total
+        profiler.switch("other", memory=True)
+        profiler.add_trees("topology", total_trees if weights is None
+                           else len(weights))
+        print_credible_set(topology_counts, total_trees, args.credible,
+                           args.top, taxa_dict)
+        sys.exit()
+
+    tree_texts = [tree_text for treefile in args.tree
+                  for tree_text in parse_treefile(treefile)]
+    memo = TopologyMemo(memo_size)
+    (topology_counts, total_trees) = posterior_topologies(
+        tree_texts, args.posterior, rooted, args.engine,
+        not args.no_cache, memo)
+    if memo.hits + memo.misses:
+        sys.stderr.write(memo.report())
+
+    if len(tree_texts) == 1:
+        topology_count = topology_counts[0]
+        output = (
+            "Trees total: {0}\n"
+            "Trees with input topology: {1}\n"
+            "Posterior probability: {2:.4g}\n").format(
+                format_count(total_trees), format_count(topology_count),
+                topology_count/total_trees)
+        print(output)
+    else:
+        print("\t".join(["tree", "trees_total", "trees_with_topology",
+                         "posterior"]))
+        for tree_text, topology_count in zip(tree_texts, topology_counts):
+            print("\t".join([tree_text, format_count(total_trees),
+                             format_count(topology_count),
+                             "{0:.4g}".format(topology_count/total_trees)]))